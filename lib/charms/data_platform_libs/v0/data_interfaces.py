@@ -70,6 +70,34 @@ which are listed below:
 -  endpoints_changed: event emitted when the read/write endpoints of the database have changed.
 -  read_only_endpoints_changed: event emitted when the read-only endpoints of the database
   have changed. Event is not triggered if read/write endpoints changed too.
+-  database_ready: single event emitted per relation change, carrying the whole diff of the
+  relation databag, in place of the events above. Only emitted when the requirer is created
+  with `coalesce_events=True`.
+
+Charms that run a single reconcile loop for every database change can opt in to the
+coalesced event, so that their handler runs once per relation change:
+
+```python
+
+from charms.data_platform_libs.v0.data_interfaces import (
+    DatabaseReadyEvent,
+    DatabaseRequires,
+)
+
+class ApplicationCharm(CharmBase):
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.database = DatabaseRequires(
+            self, relation_name="database", database_name="database", coalesce_events=True
+        )
+        self.framework.observe(self.database.on.database_ready, self._on_database_ready)
+
+    def _on_database_ready(self, event: DatabaseReadyEvent) -> None:
+        if "endpoints" in event.diff.changed:
+            ...
+        self._reconcile(event.connection_info)
+```
 
 If it is needed to connect multiple database clusters to the same relation endpoint
 the application charm can implement the same code as if it would connect to only
@@ -283,7 +311,7 @@ import logging
 from abc import ABC, abstractmethod
 from collections import namedtuple
 from datetime import datetime
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 
 from ops.charm import (
     CharmBase,
@@ -303,6 +331,7 @@ LIBAPI = 0
 
 # Increment this PATCH version before using `charmcraft publish-lib` or reset
 # to 0 if you are raising the major API version
+# Local fork of upstream patch 7 (see "Forked libraries" in the README), not a release.
 LIBPATCH = 7
 
 PYDEPS = ["ops>=2.0.0"]
@@ -707,6 +736,53 @@ class DatabaseReadOnlyEndpointsChangedEvent(AuthenticationEvent, DatabaseRequire
     """Event emitted when the read only endpoints are changed."""
 
 
+class DatabaseReadyEvent(AuthenticationEvent, DatabaseRequiresEvent):
+    """Event emitted once per relation change when events are coalesced.
+
+    Carries the diff of the relation databag that triggered it, so that handlers
+    can tell a newly created database from changed endpoints.
+    """
+
+    def __init__(self, handle, relation, app=None, unit=None, diff: Optional[Diff] = None):
+        super().__init__(handle, relation, app=app, unit=unit)
+        self.diff = diff if diff is not None else Diff(set(), set(), set())
+
+    def snapshot(self) -> dict:
+        """Save event information."""
+        snapshot = super().snapshot()
+        snapshot["diff"] = {
+            "added": sorted(self.diff.added),
+            "changed": sorted(self.diff.changed),
+            "deleted": sorted(self.diff.deleted),
+        }
+        return snapshot
+
+    def restore(self, snapshot: dict) -> None:
+        """Restore event information."""
+        super().restore(snapshot)
+        diff = snapshot["diff"]
+        self.diff = Diff(set(diff["added"]), set(diff["changed"]), set(diff["deleted"]))
+
+    @property
+    def connection_info(self) -> dict:
+        """Returns the connection information shared by the database charm.
+
+        The endpoints are returned as lists and `tls` as a boolean, other fields are
+        returned as found in the relation databag.
+        """
+        info: Dict[str, Any] = {}
+        for key, value in self.relation.data[self.relation.app].items():
+            if key == "data":
+                continue
+            if key in ("endpoints", "read-only-endpoints"):
+                info[key] = [endpoint for endpoint in value.split(",") if endpoint]
+            elif key == "tls":
+                info[key] = value.lower() == "true"
+            else:
+                info[key] = value
+        return info
+
+
 class DatabaseRequiresEvents(CharmEvents):
     """Database events.
 
@@ -716,6 +792,7 @@ class DatabaseRequiresEvents(CharmEvents):
     database_created = EventSource(DatabaseCreatedEvent)
     endpoints_changed = EventSource(DatabaseEndpointsChangedEvent)
     read_only_endpoints_changed = EventSource(DatabaseReadOnlyEndpointsChangedEvent)
+    database_ready = EventSource(DatabaseReadyEvent)
 
 
 # Database Provider and Requires
@@ -811,11 +888,24 @@ class DatabaseRequires(DataRequires):
         database_name: str,
         extra_user_roles: str = None,
         relations_aliases: List[str] = None,
+        coalesce_events: bool = False,
     ):
-        """Manager of database client relations."""
+        """Manager of database client relations.
+
+        Args:
+            charm: the charm that owns the relation.
+            relation_name: the name of the relation.
+            database_name: the name of the database to request.
+            extra_user_roles: roles to request for the created user.
+            relations_aliases: aliases to use for each relation.
+            coalesce_events: when True, a single `database_ready` event is emitted
+                per relation change instead of `database_created`, `endpoints_changed`
+                and `read_only_endpoints_changed`.
+        """
         super().__init__(charm, relation_name, extra_user_roles)
         self.database = database_name
         self.relations_aliases = relations_aliases
+        self.coalesce_events = coalesce_events
 
         # Define custom event names for each alias.
         if relations_aliases:
@@ -837,6 +927,7 @@ class DatabaseRequires(DataRequires):
                     f"{relation_alias}_read_only_endpoints_changed",
                     DatabaseReadOnlyEndpointsChangedEvent,
                 )
+                self.on.define_event(f"{relation_alias}_database_ready", DatabaseReadyEvent)
 
     def _assign_relation_alias(self, relation_id: int) -> None:
         """Assigns an alias to a relation.
@@ -871,17 +962,18 @@ class DatabaseRequires(DataRequires):
         relation = self.charm.model.get_relation(self.relation_name, relation_id)
         relation.data[self.local_unit].update({"alias": available_aliases[0]})
 
-    def _emit_aliased_event(self, event: RelationChangedEvent, event_name: str) -> None:
+    def _emit_aliased_event(self, event: RelationChangedEvent, event_name: str, **kwargs) -> None:
         """Emit an aliased event to a particular relation if it has an alias.
 
         Args:
             event: the relation changed event that was received.
             event_name: the name of the event to emit.
+            kwargs: extra arguments passed to the emitted event.
         """
         alias = self._get_relation_alias(event.relation.id)
         if alias:
             getattr(self.on, f"{alias}_{event_name}").emit(
-                event.relation, app=event.app, unit=event.unit
+                event.relation, app=event.app, unit=event.unit, **kwargs
             )
 
     def _get_relation_alias(self, relation_id: int) -> Optional[str]:
@@ -921,6 +1013,10 @@ class DatabaseRequires(DataRequires):
         # Check which data has changed to emit customs events.
         diff = self._diff(event)
 
+        if self.coalesce_events:
+            self._emit_database_ready_event(event, diff)
+            return
+
         # Check if the database is created
         # (the database charm shared the credentials).
         if "username" in diff.added and "password" in diff.added:
@@ -961,6 +1057,22 @@ class DatabaseRequires(DataRequires):
             # Emit the aliased event (if any).
             self._emit_aliased_event(event, "read_only_endpoints_changed")
 
+    def _emit_database_ready_event(self, event: RelationChangedEvent, diff: Diff) -> None:
+        """Emit a single event carrying the whole diff of the relation databag.
+
+        Args:
+            event: the relation changed event that was received.
+            diff: the diff of the relation databag.
+        """
+        # Nothing to reconcile until the database charm shared the credentials.
+        if not self._is_resource_created_for_relation(event.relation):
+            return
+        if not (diff.added or diff.changed or diff.deleted):
+            return
+        logger.info("database ready at %s", datetime.now())
+        self.on.database_ready.emit(event.relation, app=event.app, unit=event.unit, diff=diff)
+        self._emit_aliased_event(event, "database_ready", diff=diff)
+
 
 # Kafka related events
 
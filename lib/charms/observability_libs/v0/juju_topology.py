@@ -67,17 +67,45 @@ topology = JujuTopology(
 ```
 
 """
+import re
+import sys
 import warnings
 from collections import OrderedDict
+from functools import lru_cache
 from typing import Dict, List, Optional
-from uuid import UUID
 
 # The unique Charmhub library identifier, never change it
 LIBID = "bced1658f20f49d28b88f61f83c2d232"
 
 LIBAPI = 0
+# Local fork of upstream patch 5 (see "Forked libraries" in the README), not a release.
 LIBPATCH = 5
 
+# Canonical (lowercase, hyphenated) form of a version 4 UUID, as generated by Juju.
+_UUID_V4_PATTERN = re.compile(
+    r"[0-9a-f]{8}-[0-9a-f]{4}-4[0-9a-f]{3}-[89ab][0-9a-f]{3}-[0-9a-f]{12}"
+)
+
+_deprecation_warned = False
+
+
+def _warn_deprecated():
+    """Emit the deprecation warning once per process rather than once per instance."""
+    global _deprecation_warned
+    if _deprecation_warned:
+        return
+    _deprecation_warned = True
+    # Attribute the warning to the first caller outside this library, which is more or fewer
+    # frames away depending on whether the constructor or a factory method was called.
+    frame, stacklevel = sys._getframe(), 1
+    while frame.f_back is not None and frame.f_globals.get("__name__") == __name__:
+        frame, stacklevel = frame.f_back, stacklevel + 1
+    warnings.warn(
+        "observability_libs.v0.juju_topology is deprecated. Use `pip install cosl` instead",
+        category=DeprecationWarning,
+        stacklevel=stacklevel,
+    )
+
 
 class InvalidUUIDError(Exception):
     """Invalid UUID was provided."""
@@ -92,8 +120,22 @@ class JujuTopology:
 
     DEPRECATED: This class is deprecated. Use `pip install cosl` and
     `from cosl.juju_topology import JujuTopology` instead.
+
+    Instances are immutable and hashable, so they may be shared and used as cache keys. The
+    derived `identifier`, `label_matcher_dict` and `label_matchers` values are computed once.
     """
 
+    __slots__ = (
+        "_model",
+        "_model_uuid",
+        "_application",
+        "_unit",
+        "_charm_name",
+        "_identifier",
+        "_label_matcher_dict",
+        "_label_matchers",
+    )
+
     def __init__(
         self,
         model: str,
@@ -120,19 +162,67 @@ class JujuTopology:
             unit: a unit name as a string
             charm_name: name of charm as a string
         """
-        warnings.warn(
-            "observability_libs.v0.juju_topology is deprecated. Use `pip install cosl` instead",
-            category=DeprecationWarning,
-        )
+        _warn_deprecated()
 
         if not self.is_valid_uuid(model_uuid):
             raise InvalidUUIDError(model_uuid)
 
-        self._model = model
-        self._model_uuid = model_uuid
-        self._application = application
-        self._charm_name = charm_name
-        self._unit = unit
+        init = super().__setattr__
+        init("_model", model)
+        init("_model_uuid", model_uuid)
+        init("_application", application)
+        init("_charm_name", charm_name)
+        init("_unit", unit)
+
+        # Topology labels never include the unit as they would then only match the leader unit
+        # (ie. the unit that produced them).
+        labels = self.as_dict(remapped_keys={"charm_name": "charm"}, excluded_keys=["unit"])
+        label_matcher_dict = {
+            "juju_{}".format(key): value for key, value in labels.items() if value
+        }
+        init("_label_matcher_dict", label_matcher_dict)
+        init(
+            "_label_matchers",
+            ", ".join(['{}="{}"'.format(key, value) for key, value in label_matcher_dict.items()]),
+        )
+        init(
+            "_identifier",
+            "_".join([str(val) for val in (model, self.model_uuid_short, application)]).replace(
+                "/", "_"
+            ),
+        )
+
+    def __setattr__(self, name, value):
+        """JujuTopology objects are immutable."""
+        raise AttributeError("JujuTopology objects are immutable")
+
+    def __delattr__(self, name):
+        """JujuTopology objects are immutable."""
+        raise AttributeError("JujuTopology objects are immutable")
+
+    def _key(self) -> tuple:
+        """The topology values identifying this object, used for equality and hashing."""
+        return (self._model, self._model_uuid, self._application, self._unit, self._charm_name)
+
+    def __eq__(self, other) -> bool:
+        """Two topologies are equal when all their topology values are equal."""
+        if not isinstance(other, JujuTopology):
+            return NotImplemented
+        return self._key() == other._key()
+
+    def __hash__(self) -> int:
+        """Hash of the topology values."""
+        return hash(self._key())
+
+    def __reduce__(self):
+        """Support copying and pickling despite the immutability."""
+        return (self.__class__, self._key())
+
+    def __repr__(self) -> str:
+        """Unambiguous representation of the topology."""
+        fields = ("model", "model_uuid", "application", "unit", "charm_name")
+        values = ", ".join("{}={!r}".format(k, v) for k, v in zip(fields, self._key()))
+        return "{}({})".format(type(self).__name__, values)
 
     def is_valid_uuid(self, uuid):
         """Validate the supplied UUID against the Juju Model UUID pattern.
@@ -143,10 +233,23 @@ class JujuTopology:
         Returns:
             True if parameter is a valid v4 UUID, False otherwise.
         """
-        try:
-            return str(UUID(uuid, version=4)) == uuid
-        except (ValueError, TypeError):
-            return False
+        return isinstance(uuid, str) and _UUID_V4_PATTERN.fullmatch(uuid) is not None
+
+    @classmethod
+    def _cached(
+        cls,
+        model: str,
+        model_uuid: str,
+        application: str,
+        unit: Optional[str],
+        charm_name: Optional[str],
+    ):
+        """Returns a shared instance for the given topology, building it on first use.
+
+        Instances are never mutated after construction, so the factory methods hand out the
+        same object for identical topologies instead of re-validating them on every call.
+        """
+        return _build_topology(cls, model, model_uuid, application, unit, charm_name)
 
     @classmethod
     def from_charm(cls, charm):
@@ -157,12 +260,12 @@ class JujuTopology:
         Returns:
             a `JujuTopology` object.
         """
-        return cls(
-            model=charm.model.name,
-            model_uuid=charm.model.uuid,
-            application=charm.model.app.name,
-            unit=charm.model.unit.name,
-            charm_name=charm.meta.name,
+        return cls._cached(
+            charm.model.name,
+            charm.model.uuid,
+            charm.model.app.name,
+            charm.model.unit.name,
+            charm.meta.name,
         )
 
     @classmethod
@@ -182,12 +285,12 @@ class JujuTopology:
         Returns:
             a `JujuTopology` object.
         """
-        return cls(
-            model=data["model"],
-            model_uuid=data["model_uuid"],
-            application=data["application"],
-            unit=data.get("unit", ""),
-            charm_name=data.get("charm_name", ""),
+        return cls._cached(
+            data["model"],
+            data["model_uuid"],
+            data["application"],
+            data.get("unit", ""),
+            data.get("charm_name", ""),
         )
 
     def as_dict(
@@ -242,14 +345,7 @@ class JujuTopology:
             ).identifier
         'a-model_00000000_some-app'
         """
-        parts = self.as_dict(
-            excluded_keys=["unit", "charm_name"],
-        )
-
-        parts["model_uuid"] = self.model_uuid_short
-        values = parts.values()
-
-        return "_".join([str(val) for val in values]).replace("/", "_")
+        return self._identifier
 
     @property
     def label_matcher_dict(self) -> Dict[str, str]:
@@ -258,12 +354,7 @@ class JujuTopology:
         Relabelled topology never includes the unit as it would then only match
         the leader unit (ie. the unit that produced the dict).
         """
-        items = self.as_dict(
-            remapped_keys={"charm_name": "charm"},
-            excluded_keys=["unit"],
-        ).items()
-
-        return {"juju_{}".format(key): value for key, value in items if value}
+        return dict(self._label_matcher_dict)
 
     @property
     def label_matchers(self) -> str:
@@ -273,8 +364,7 @@ class JujuTopology:
         would then only match the leader unit (ie. the unit that
         produced the matchers).
         """
-        items = self.label_matcher_dict.items()
-        return ", ".join(['{}="{}"'.format(key, value) for key, value in items if value])
+        return self._label_matchers
 
     @property
     def model(self) -> str:
@@ -305,3 +395,15 @@ class JujuTopology:
     def unit(self) -> Optional[str]:
         """Getter for the juju unit value."""
         return self._unit
+
+
+@lru_cache(maxsize=1024)
+def _build_topology(cls, model, model_uuid, application, unit, charm_name):
+    """LRU-cached constructor backing `JujuTopology.from_charm` and `JujuTopology.from_dict`."""
+    return cls(
+        model=model,
+        model_uuid=model_uuid,
+        application=application,
+        unit=unit,
+        charm_name=charm_name,
+    )
@@ -109,6 +109,51 @@ class SomeCharm(CharmBase):
     # ...
 ```
 
+The service can also be applied with Kubernetes server-side apply. The patch is then a single,
+idempotent API call owned by a field manager (the application name by default). Changes to port
+protocols or names are picked up, and a service with a custom name is created next to the one
+created by Juju instead of replacing it, so the live service is never deleted.
+
+```python
+from charms.observability_libs.v1.kubernetes_service_patch import KubernetesServicePatch
+from lightkube.models.core_v1 import ServicePort
+
+class SomeCharm(CharmBase):
+  def __init__(self, *args):
+    # ...
+    port = ServicePort(8805, name="pfcp", protocol="UDP")
+    self.service_patcher = KubernetesServicePatch(
+        self,
+        [port],
+        server_side_apply=True,
+    )
+    # ...
+```
+
+Additional services, for example to expose a UDP port through a `LoadBalancer` while keeping the
+source address of the clients, can be created by giving them a name. Each patcher must then
+use its own service name:
+
+```python
+from charms.observability_libs.v1.kubernetes_service_patch import KubernetesServicePatch
+from lightkube.models.core_v1 import ServicePort
+
+class SomeCharm(CharmBase):
+  def __init__(self, *args):
+    # ...
+    port = ServicePort(8805, name="pfcp", protocol="UDP")
+    self.pfcp_service_patcher = KubernetesServicePatch(
+        self,
+        [port],
+        service_name=f"{self.app.name}-pfcp",
+        service_type="LoadBalancer",
+        external_traffic_policy="Local",
+        session_affinity="ClientIP",
+        server_side_apply=True,
+    )
+    # ...
+```
+
 Additionally, you may wish to use mocks in your charm's unit testing to ensure that the library
 does not try to make any API calls, or open any files during testing that are unlikely to be
 present, and could break your tests. The easiest way to do this is during your test `setUp`:
@@ -124,6 +169,7 @@ def setUp(self, *unused):
 """
 
 import logging
+from functools import lru_cache
 from types import MethodType
 from typing import List, Literal, Optional, Union
 
@@ -146,9 +192,40 @@ LIBAPI = 1
 
 # Increment this PATCH version before using `charmcraft publish-lib` or reset
 # to 0 if you are raising the major API version
+# Local fork of upstream patch 5 (see "Forked libraries" in the README), not a release.
 LIBPATCH = 5
 
-ServiceType = Literal["ClusterIP", "LoadBalancer"]
+ServiceType = Literal["ClusterIP", "LoadBalancer", "NodePort"]
+
+NAMESPACE_FILE = "/var/run/secrets/kubernetes.io/serviceaccount/namespace"
+
+_client: Optional[Client] = None
+
+
+def _get_client() -> Client:
+    """Returns the lightkube client shared by every patcher in this process.
+
+    The client is created on first use, so that kubeconfig and service account tokens are
+    read, and the connection to the API server opened, only once per hook.
+
+    Raises:
+        ConfigError: if the client can't be configured.
+    """
+    global _client
+    if _client is None:
+        _client = Client()
+    return _client
+
+
+@lru_cache(maxsize=None)
+def _read_namespace() -> str:
+    """Reads the Kubernetes namespace of the pod from its service account.
+
+    Returns:
+        str: A string containing the name of the current Kubernetes namespace.
+    """
+    with open(NAMESPACE_FILE, "r") as f:
+        return f.read().strip()
 
 
 class KubernetesServicePatch(Object):
@@ -165,6 +242,10 @@ class KubernetesServicePatch(Object):
         additional_annotations: Optional[dict] = None,
         *,
         refresh_event: Optional[Union[BoundEvent, List[BoundEvent]]] = None,
+        server_side_apply: bool = False,
+        field_manager: Optional[str] = None,
+        external_traffic_policy: Optional[str] = None,
+        session_affinity: Optional[str] = None,
     ):
         """Constructor for KubernetesServicePatch.
 
@@ -183,10 +264,23 @@ class KubernetesServicePatch(Object):
             refresh_event: an optional bound event or list of bound events which
                 will be observed to re-apply the patch (e.g. on port change).
                 The `install` and `upgrade-charm` events would be observed regardless.
+            server_side_apply: whether to apply the service with server-side apply instead of
+                comparing the live service and merge patching it.
+            field_manager: name of the field manager used for server-side apply. If none given,
+                application name will be used.
+            external_traffic_policy: external traffic policy of `LoadBalancer` and `NodePort`
+                services, either "Cluster" or "Local".
+            session_affinity: session affinity of the service, either "None" or "ClientIP".
         """
-        super().__init__(charm, "kubernetes-service-patch")
+        # Patchers of additional services need their own handle to be observed separately.
+        key = "kubernetes-service-patch"
+        if service_name and service_name != charm.app.name:
+            key = f"{key}-{service_name}"
+        super().__init__(charm, key)
         self.charm = charm
         self.service_name = service_name if service_name else self._app
+        self.server_side_apply = server_side_apply
+        self.field_manager = field_manager if field_manager else self._app
         self.service = self._service_object(
             ports,
             service_name,
@@ -194,6 +288,8 @@ class KubernetesServicePatch(Object):
             additional_labels,
             additional_selectors,
             additional_annotations,
+            external_traffic_policy=external_traffic_policy,
+            session_affinity=session_affinity,
         )
 
         # Make mypy type checking happy that self._patch is a method
@@ -218,6 +314,9 @@ class KubernetesServicePatch(Object):
         additional_labels: Optional[dict] = None,
         additional_selectors: Optional[dict] = None,
         additional_annotations: Optional[dict] = None,
+        *,
+        external_traffic_policy: Optional[str] = None,
+        session_affinity: Optional[str] = None,
     ) -> Service:
         """Creates a valid Service representation.
 
@@ -232,6 +331,9 @@ class KubernetesServicePatch(Object):
             additional_selectors: Selectors to be added to the kubernetes service (by default only
                 "app.kubernetes.io/name" is set to the service name)
             additional_annotations: Annotations to be added to the kubernetes service.
+            external_traffic_policy: external traffic policy of `LoadBalancer` and `NodePort`
+                services, either "Cluster" or "Local".
+            session_affinity: session affinity of the service, either "None" or "ClientIP".
 
         Returns:
             Service: A valid representation of a Kubernetes Service with the correct ports.
@@ -257,6 +359,8 @@ class KubernetesServicePatch(Object):
                 selector=selector,
                 ports=ports,
                 type=service_type,
+                externalTrafficPolicy=external_traffic_policy,
+                sessionAffinity=session_affinity,
             ),
         )
 
@@ -267,17 +371,20 @@ class KubernetesServicePatch(Object):
             PatchFailed: if patching fails due to lack of permissions, or otherwise.
         """
         try:
-            client = Client()
+            client = _get_client()
         except exceptions.ConfigError as e:
             logger.warning("Error creating k8s client: %s", e)
             return
 
         try:
-            if self._is_patched(client):
-                return
-            if self.service_name != self._app:
-                self._delete_and_create_service(client)
-            client.patch(Service, self.service_name, self.service, patch_type=PatchType.MERGE)
+            if self.server_side_apply:
+                client.apply(self.service, field_manager=self.field_manager, force=True)
+            else:
+                if self._is_patched(client):
+                    return
+                if self.service_name != self._app:
+                    self._delete_and_create_service(client)
+                client.patch(Service, self.service_name, self.service, patch_type=PatchType.MERGE)
         except ApiError as e:
             if e.status.code == 403:
                 logger.error("Kubernetes service patch failed: `juju trust` this application.")
@@ -299,7 +406,7 @@ class KubernetesServicePatch(Object):
         Returns:
             bool: A boolean indicating if the service patch has been applied.
         """
-        client = Client()
+        client = _get_client()
         return self._is_patched(client)
 
     def _is_patched(self, client: Client) -> bool:
@@ -314,13 +421,21 @@ class KubernetesServicePatch(Object):
                 raise
 
         # Construct a list of expected ports, should the patch be applied
-        expected_ports = [(p.port, p.targetPort) for p in self.service.spec.ports]
+        expected_ports = [self._port_key(p) for p in self.service.spec.ports]
         # Construct a list in the same manner, using the fetched service
         fetched_ports = [
-            (p.port, p.targetPort) for p in service.spec.ports  # type: ignore[attr-defined]
+            self._port_key(p) for p in service.spec.ports  # type: ignore[attr-defined]
         ]  # noqa: E501
         return expected_ports == fetched_ports
 
+    @staticmethod
+    def _port_key(port: ServicePort) -> tuple:
+        """Returns the fields of a ServicePort that must match for the patch to be applied.
+
+        Kubernetes defaults the protocol to TCP, so a port without protocol is compared as such.
+        """
+        return port.name, port.port, port.targetPort, port.protocol or "TCP"
+
     @property
     def _app(self) -> str:
         """Name of the current Juju application.
@@ -337,5 +452,4 @@ class KubernetesServicePatch(Object):
         Returns:
             str: A string containing the name of the current Kubernetes namespace.
         """
-        with open("/var/run/secrets/kubernetes.io/serviceaccount/namespace", "r") as f:
-            return f.read().strip()
+        return _read_namespace()
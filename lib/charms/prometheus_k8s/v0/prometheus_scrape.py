@@ -329,7 +329,6 @@ of Metrics provider charms hold eponymous information.
 
 """  # noqa: W505
 
-import copy
 import hashlib
 import ipaddress
 import json
@@ -340,6 +339,8 @@ import re
 import socket
 import subprocess
 import tempfile
+import threading
+import time
 from collections import defaultdict
 from pathlib import Path
 from typing import Any, Callable, Dict, List, Optional, Tuple, Union
@@ -368,6 +369,7 @@ LIBAPI = 0
 
 # Increment this PATCH version before using `charmcraft publish-lib` or reset
 # to 0 if you are raising the major API version
+# Local fork of upstream patch 30 (see "Forked libraries" in the README), not a release.
 LIBPATCH = 30
 
 logger = logging.getLogger(__name__)
@@ -382,6 +384,7 @@ ALLOWED_KEYS = {
     "proxy_url",
     "relabel_configs",
     "metrics_relabel_configs",
+    "metric_relabel_configs",
     "sample_limit",
     "label_limit",
     "label_name_length_limit",
@@ -400,6 +403,13 @@ DEFAULT_RELATION_NAME = "metrics-endpoint"
 RELATION_INTERFACE_NAME = "prometheus_scrape"
 
 DEFAULT_ALERT_RULES_RELATIVE_PATH = "./src/prometheus_alert_rules"
+WILDCARD_TARGET_PATTERN = re.compile(r"\*(?:(:\d+))?")
+ALERT_RULES_SUFFIXES = [".rule", ".rules", ".yml", ".yaml"]
+# Reverse DNS lookups of aggregated targets: overall time budget per scrape job in seconds,
+# maximum number of concurrent lookups and how long results are cached, in seconds.
+DNS_LOOKUP_TIMEOUT = 5.0
+DNS_LOOKUP_MAX_WORKERS = 8
+DNS_CACHE_TTL = 3600
 
 
 class PrometheusConfig:
@@ -478,7 +488,10 @@ class PrometheusConfig:
                 must be constructed.
             topology: optional arg for adding topology labels to scrape targets.
         """
-        # hosts = self._relation_hosts(relation)
+        # Topology labels are the same for every job and unit
+        topology_labels = topology.label_matcher_dict if topology else {}
+        # Unit numbers used as job name suffixes
+        unit_nums = {unit_name: unit_name.split("/")[-1] for unit_name in hosts}
 
         modified_scrape_jobs = []
         for job in scrape_jobs:
@@ -486,6 +499,12 @@ class PrometheusConfig:
             if not static_configs:
                 continue
 
+            job_name = job.get("job_name", "unnamed-job")
+            metrics_path = job.get("metrics_path") or "/metrics"
+            wildcard_relabel_configs = job.get("relabel_configs", []) + [
+                PrometheusConfig.topology_relabel_config_wildcard
+            ]
+
             # When a single unit specified more than one wildcard target, then they are expanded
             # into a static_config per target
             non_wildcard_static_configs = []
@@ -503,8 +522,7 @@ class PrometheusConfig:
                 wildcard_targets = []
 
                 for target in targets:
-                    match = re.compile(r"\*(?:(:\d+))?").match(target)
-                    if match:
+                    if WILDCARD_TARGET_PATTERN.match(target):
                         # This is a wildcard target.
                         # Need to expand into separate jobs and remove it from this job here
                         wildcard_targets.append(target)
@@ -514,8 +532,7 @@ class PrometheusConfig:
 
                 # All non-wildcard targets remain in the same static_config
                 if non_wildcard_targets:
-                    non_wildcard_static_config = static_config.copy()
-                    non_wildcard_static_config["targets"] = non_wildcard_targets
+                    non_wildcard_static_config = dict(static_config, targets=non_wildcard_targets)
 
                     if topology:
                         # When non-wildcard targets (aka fully qualified hostnames) are specified,
@@ -523,52 +540,49 @@ class PrometheusConfig:
                         # for such a target. Therefore labeling with Juju topology, excluding the
                         # unit name.
                         non_wildcard_static_config["labels"] = {
-                            **non_wildcard_static_config.get("labels", {}),
-                            **topology.label_matcher_dict,
+                            **static_config.get("labels", {}),
+                            **topology_labels,
                         }
 
                     non_wildcard_static_configs.append(non_wildcard_static_config)
 
                 # Extract wildcard targets into individual jobs
                 if wildcard_targets:
+                    wildcard_labels = {**static_config.get("labels", {}), **topology_labels}
                     for unit_name, (unit_hostname, unit_path) in hosts.items():
-                        modified_job = job.copy()
-                        modified_job["static_configs"] = [static_config.copy()]
-                        modified_static_config = modified_job["static_configs"][0]
-                        modified_static_config["targets"] = [
-                            target.replace("*", unit_hostname) for target in wildcard_targets
-                        ]
-
-                        unit_num = unit_name.split("/")[-1]
-                        job_name = modified_job.get("job_name", "unnamed-job") + "-" + unit_num
-                        modified_job["job_name"] = job_name
-                        modified_job["metrics_path"] = unit_path + (
-                            job.get("metrics_path") or "/metrics"
+                        modified_static_config = dict(
+                            static_config,
+                            targets=[
+                                target.replace("*", unit_hostname) for target in wildcard_targets
+                            ],
+                        )
+                        modified_job = dict(
+                            job,
+                            static_configs=[modified_static_config],
+                            job_name=job_name + "-" + unit_nums[unit_name],
+                            metrics_path=unit_path + metrics_path,
                         )
 
                         if topology:
                             # Add topology labels
                             modified_static_config["labels"] = {
-                                **modified_static_config.get("labels", {}),
-                                **topology.label_matcher_dict,
-                                **{"juju_unit": unit_name},
+                                **wildcard_labels,
+                                "juju_unit": unit_name,
                             }
 
                             # Instance relabeling for topology should be last in order.
-                            modified_job["relabel_configs"] = modified_job.get(
-                                "relabel_configs", []
-                            ) + [PrometheusConfig.topology_relabel_config_wildcard]
+                            modified_job["relabel_configs"] = list(wildcard_relabel_configs)
 
                         modified_scrape_jobs.append(modified_job)
 
             if non_wildcard_static_configs:
-                modified_job = job.copy()
-                modified_job["static_configs"] = non_wildcard_static_configs
-                modified_job["metrics_path"] = modified_job.get("metrics_path") or "/metrics"
+                modified_job = dict(
+                    job, static_configs=non_wildcard_static_configs, metrics_path=metrics_path
+                )
 
                 if topology:
                     # Instance relabeling for topology should be last in order.
-                    modified_job["relabel_configs"] = modified_job.get("relabel_configs", []) + [
+                    modified_job["relabel_configs"] = job.get("relabel_configs", []) + [
                         PrometheusConfig.topology_relabel_config
                     ]
 
@@ -705,6 +719,87 @@ def _type_convert_stored(obj):
         return obj
 
 
+def _canonical_json(obj: Any) -> str:
+    """Serialise an object to canonical JSON, with sorted keys and compact separators.
+
+    Every relation data payload and content hash in this library is produced with this
+    encoder, so that equal data always results in byte-identical strings and unchanged
+    payloads never trigger relation-changed events.
+
+    Args:
+        obj: a JSON serialisable object.
+
+    Returns:
+        the canonical JSON representation of the object.
+    """
+    return json.dumps(obj, sort_keys=True, separators=(",", ":"))
+
+
+def _update_changed_relation_data(databag, data: Dict[str, str]) -> None:
+    """Write only the keys whose value differs from the one already in the databag.
+
+    Every write is a `relation-set`, which may trigger relation-changed events on
+    all the related units, so values that did not change are not written again.
+
+    Args:
+        databag: the relation databag to update.
+        data: the keys and values that must be set in the databag.
+    """
+    for key, value in data.items():
+        # Setting a key to an empty string removes it from the databag
+        if databag.get(key, "") != value:
+            databag[key] = value
+
+
+def _reverse_lookup_all(hostnames: List[str], timeout: float, max_workers: int) -> Dict[str, str]:
+    """Perform reverse DNS lookups of several addresses concurrently.
+
+    Lookups run in a bounded pool of daemon threads, so lookups that are still pending when
+    the time budget runs out neither block the caller nor the exit of the hook.
+
+    Args:
+        hostnames: addresses to look up.
+        timeout: overall time budget in seconds.
+        max_workers: maximum number of concurrent lookups.
+
+    Returns:
+        a dictionary mapping each address whose lookup completed in time to its DNS name. The
+        address itself is used as the name when it could not be resolved.
+    """
+    pending = list(dict.fromkeys(hostnames))
+    results = {}  # type: Dict[str, str]
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                if not pending:
+                    return
+                hostname = pending.pop()
+            try:
+                dns_name = socket.gethostbyaddr(hostname)[0]
+            except OSError:
+                logger.debug("Could not perform DNS lookup for %s", hostname)
+                dns_name = hostname
+            with lock:
+                results[hostname] = dns_name
+
+    workers = [
+        threading.Thread(target=worker, daemon=True) for _ in range(min(max_workers, len(pending)))
+    ]
+    for thread in workers:
+        thread.start()
+    deadline = time.monotonic() + timeout
+    for thread in workers:
+        thread.join(max(0.0, deadline - time.monotonic()))
+
+    with lock:
+        timed_out = [hostname for hostname in hostnames if hostname not in results]
+        if timed_out:
+            logger.warning("DNS lookup timed out for %s", ", ".join(timed_out))
+        return dict(results)
+
+
 def _validate_relation_by_interface_and_direction(
     charm: CharmBase,
     relation_name: str,
@@ -850,7 +945,10 @@ class AlertRules:
         self.alert_groups = []  # type: List[dict]
 
     def _from_file(self, root_path: Path, file_path: Path) -> List[dict]:
-        """Read a rules file from path, injecting juju topology.
+        """Read a rules file from path, adding juju topology labels.
+
+        Juju topology label matchers are injected into the expressions by `add_path`,
+        for all files at once.
 
         Args:
             root_path: full path to the root rules folder (used only for generating group name)
@@ -902,14 +1000,26 @@ class AlertRules:
 
                     if self.topology:
                         alert_rule["labels"].update(self.topology.label_matcher_dict)
-                        # insert juju topology filters into a prometheus alert rule
-                        alert_rule["expr"] = self.tool.inject_label_matchers(
-                            re.sub(r"%%juju_topology%%,?", "", alert_rule["expr"]),
-                            self.topology.label_matcher_dict,
-                        )
+                        alert_rule["expr"] = re.sub(r"%%juju_topology%%,?", "", alert_rule["expr"])
 
             return alert_groups
 
+    def _inject_label_matchers(self, alert_groups: List[dict]) -> None:
+        """Insert juju topology filters into the expressions of all the given alert rules.
+
+        Args:
+            alert_groups: a list of alert rule groups, updated in place.
+        """
+        if not self.topology:
+            return
+        alert_rules = [rule for group in alert_groups for rule in group["rules"]]
+        topology = self.topology.label_matcher_dict
+        expressions = self.tool.inject_label_matchers_batch(
+            [(rule["expr"], topology) for rule in alert_rules]
+        )
+        for rule, expression in zip(alert_rules, expressions):
+            rule["expr"] = expression
+
     def _group_name(self, root_path: str, file_path: str, group_name: str) -> str:
         """Generate group name from path and topology.
 
@@ -970,9 +1080,7 @@ class AlertRules:
         alert_groups = []  # type: List[dict]
 
         # Gather all alerts into a list of groups
-        for file_path in self._multi_suffix_glob(
-            dir_path, [".rule", ".rules", ".yml", ".yaml"], recursive
-        ):
+        for file_path in self._multi_suffix_glob(dir_path, ALERT_RULES_SUFFIXES, recursive):
             alert_groups_from_file = self._from_file(dir_path, file_path)
             if alert_groups_from_file:
                 logger.debug("Reading alert rule from %s", file_path)
@@ -995,11 +1103,15 @@ class AlertRules:
         """
         path = Path(path)  # type: Path
         if path.is_dir():
-            self.alert_groups.extend(self._from_dir(path, recursive))
+            alert_groups = self._from_dir(path, recursive)
         elif path.is_file():
-            self.alert_groups.extend(self._from_file(path.parent, path))
+            alert_groups = self._from_file(path.parent, path)
         else:
             logger.debug("Alert rules path does not exist: %s", path)
+            return
+
+        self._inject_label_matchers(alert_groups)
+        self.alert_groups.extend(alert_groups)
 
     def as_dict(self) -> dict:
         """Return standard alert rules file in dict representation.
@@ -1038,6 +1150,7 @@ class MetricsEndpointConsumer(Object):
     """A Prometheus based Monitoring service."""
 
     on = MonitoringEvents()
+    _stored = StoredState()
 
     def __init__(self, charm: CharmBase, relation_name: str = DEFAULT_RELATION_NAME):
         """A Prometheus based Monitoring service.
@@ -1066,6 +1179,8 @@ class MetricsEndpointConsumer(Object):
         )
 
         super().__init__(charm, relation_name)
+        # JSON scrape jobs of each relation, by relation id, recomputed only on target changes
+        self._stored.set_default(scrape_jobs_by_relation={})
         self._charm = charm
         self._relation_name = relation_name
         self._tool = CosTool(self._charm)
@@ -1074,6 +1189,11 @@ class MetricsEndpointConsumer(Object):
         self.framework.observe(
             events.relation_departed, self._on_metrics_provider_relation_departed
         )
+        self.framework.observe(self._charm.on.upgrade_charm, self._on_upgrade_charm)
+
+    def _on_upgrade_charm(self, _):
+        """Drop cached scrape jobs, as they may be computed differently after an upgrade."""
+        self._stored.scrape_jobs_by_relation = {}
 
     def _on_metrics_provider_relation_changed(self, event):
         """Handle changes with related metrics providers.
@@ -1088,6 +1208,7 @@ class MetricsEndpointConsumer(Object):
                 charm must update its scrape configuration.
         """
         rel_id = event.relation.id
+        self._stored.scrape_jobs_by_relation.pop(str(rel_id), None)
 
         self.on.targets_changed.emit(relation_id=rel_id)
 
@@ -1104,11 +1225,15 @@ class MetricsEndpointConsumer(Object):
                unit has departed.
         """
         rel_id = event.relation.id
+        self._stored.scrape_jobs_by_relation.pop(str(rel_id), None)
         self.on.targets_changed.emit(relation_id=rel_id)
 
     def jobs(self) -> list:
         """Fetch the list of scrape jobs.
 
+        The scrape jobs of each relation are cached, and only recomputed for
+        relations whose targets changed since they were last computed.
+
         Returns:
             A list consisting of all the static scrape configurations
             for each related `MetricsEndpointProvider` that has specified
@@ -1116,8 +1241,16 @@ class MetricsEndpointConsumer(Object):
         """
         scrape_jobs = []
 
-        for relation in self._charm.model.relations[self._relation_name]:
-            static_scrape_jobs = self._static_scrape_config(relation)
+        relations = self._charm.model.relations[self._relation_name]
+        cached_jobs = self._stored.scrape_jobs_by_relation
+        for relation_id in set(cached_jobs.keys()) - {str(r.id) for r in relations}:
+            del cached_jobs[relation_id]
+
+        for relation in relations:
+            relation_id = str(relation.id)
+            if relation_id not in cached_jobs:
+                cached_jobs[relation_id] = _canonical_json(self._static_scrape_config(relation))
+            static_scrape_jobs = json.loads(cached_jobs[relation_id])
             if static_scrape_jobs:
                 scrape_jobs.extend(static_scrape_jobs)
 
@@ -1200,7 +1333,7 @@ class MetricsEndpointConsumer(Object):
             if errmsg:
                 if alerts[identifier]:
                     del alerts[identifier]
-                relation.data[self._charm.app]["event"] = json.dumps({"errors": errmsg})
+                relation.data[self._charm.app]["event"] = _canonical_json({"errors": errmsg})
                 continue
 
         return alerts
@@ -1329,40 +1462,33 @@ def _dedupe_job_names(jobs: List[dict]):
 
     Additionally, fully de-duplicate any identical jobs.
 
+    Each job is hashed once, over its canonical JSON representation, and jobs are grouped
+    by name in a single pass, so this is linear in the number of jobs. The input jobs are
+    not modified.
+
     Args:
         jobs: A list of prometheus scrape jobs
     """
-    jobs_copy = copy.deepcopy(jobs)
+    # Group jobs by name, keeping the order in which names first appear
+    jobs_by_name = {}  # type: Dict[str, List[Tuple[dict, str]]]
+    for job in jobs:
+        hashed = hashlib.sha256(_canonical_json(job).encode()).hexdigest()
+        jobs_by_name.setdefault(job["job_name"], []).append((job, hashed))
 
-    # Convert to a dict with job names as keys
-    # I think this line is O(n^2) but it should be okay given the list sizes
-    jobs_dict = {
-        job["job_name"]: list(filter(lambda x: x["job_name"] == job["job_name"], jobs_copy))
-        for job in jobs_copy
-    }
-
-    # If multiple jobs have the same name, convert the name to "name_<hash-of-job>"
-    for key in jobs_dict:
-        if len(jobs_dict[key]) > 1:
-            for job in jobs_dict[key]:
-                job_json = json.dumps(job)
-                hashed = hashlib.sha256(job_json.encode()).hexdigest()
-                job["job_name"] = "{}_{}".format(job["job_name"], hashed)
-    new_jobs = []
-    for key in jobs_dict:
-        new_jobs.extend([i for i in jobs_dict[key]])
-
-    # Deduplicate jobs which are equal
-    # Again this in O(n^2) but it should be okay
     deduped_jobs = []
-    seen = []
-    for job in new_jobs:
-        job_json = json.dumps(job)
-        hashed = hashlib.sha256(job_json.encode()).hexdigest()
-        if hashed in seen:
-            continue
-        seen.append(hashed)
-        deduped_jobs.append(job)
+    seen = set()
+    for job_name, named_jobs in jobs_by_name.items():
+        for job, hashed in named_jobs:
+            # If multiple jobs have the same name, convert the name to "name_<hash-of-job>"
+            if len(named_jobs) > 1:
+                job = dict(job, job_name="{}_{}".format(job_name, hashed))
+            # Renamed jobs are equal if and only if the original jobs were, so the name and
+            # the hash of the original job identify the resulting job.
+            key = (job["job_name"], hashed)
+            if key in seen:
+                continue
+            seen.add(key)
+            deduped_jobs.append(job)
 
     return deduped_jobs
 
@@ -1402,6 +1528,7 @@ class MetricsEndpointProvider(Object):
     """A metrics endpoint for Prometheus."""
 
     on = MetricsEndpointProviderEvents()
+    _stored = StoredState()
 
     def __init__(
         self,
@@ -1548,6 +1675,7 @@ class MetricsEndpointProvider(Object):
             )
 
         super().__init__(charm, relation_name)
+        self._stored.set_default(alert_rules_fingerprint="", alert_rules="")
         self.topology = JujuTopology.from_charm(charm)
 
         self._charm = charm
@@ -1628,20 +1756,64 @@ class MetricsEndpointProvider(Object):
         if not self._charm.unit.is_leader():
             return
 
+        alert_rules = self._alert_rules()
+        data = {
+            "scrape_metadata": _canonical_json(self._scrape_metadata),
+            "scrape_jobs": _canonical_json(self._scrape_jobs),
+        }
+        if alert_rules:
+            # Update relation data with the string representation of the rule file.
+            # Juju topology is already included in the "scrape_metadata" field above.
+            # The consumer side of the relation uses this information to name the rules file
+            # that is written to the filesystem.
+            data["alert_rules"] = alert_rules
+
+        for relation in self._charm.model.relations[self._relation_name]:
+            _update_changed_relation_data(relation.data[self._charm.app], data)
+
+    def _alert_rules(self) -> str:
+        """Returns the JSON representation of the alert rules shipped with the charm.
+
+        Alert rule files only change with the charm itself, so the JSON blob is kept in
+        stored state and only rebuilt when the fingerprint of the rule files changes.
+
+        Returns:
+            the JSON string of the alert rules, or an empty string if there are none.
+        """
+        fingerprint = self._alert_rules_fingerprint()
+        if fingerprint == self._stored.alert_rules_fingerprint:
+            return self._stored.alert_rules
+
         alert_rules = AlertRules(topology=self.topology)
         alert_rules.add_path(self._alert_rules_path, recursive=True)
         alert_rules_as_dict = alert_rules.as_dict()
+        self._stored.alert_rules = (
+            _canonical_json(alert_rules_as_dict) if alert_rules_as_dict else ""
+        )
+        self._stored.alert_rules_fingerprint = fingerprint
+        return self._stored.alert_rules
 
-        for relation in self._charm.model.relations[self._relation_name]:
-            relation.data[self._charm.app]["scrape_metadata"] = json.dumps(self._scrape_metadata)
-            relation.data[self._charm.app]["scrape_jobs"] = json.dumps(self._scrape_jobs)
+    def _alert_rules_fingerprint(self) -> str:
+        """Fingerprint the alert rule files from their path, modification time and size.
 
-            if alert_rules_as_dict:
-                # Update relation data with the string representation of the rule file.
-                # Juju topology is already included in the "scrape_metadata" field above.
-                # The consumer side of the relation uses this information to name the rules file
-                # that is written to the filesystem.
-                relation.data[self._charm.app]["alert_rules"] = json.dumps(alert_rules_as_dict)
+        The topology labels are included since they are injected into the rules. Files are
+        only stat'ed, not read.
+        """
+        path = Path(self._alert_rules_path)
+        if path.is_dir():
+            files = sorted(AlertRules._multi_suffix_glob(path, ALERT_RULES_SUFFIXES))
+        elif path.is_file():
+            files = [path]
+        else:
+            files = []
+
+        fingerprint = hashlib.sha256(self.topology.label_matchers.encode())
+        for file_path in files:
+            stat = file_path.stat()
+            fingerprint.update(
+                "{}:{}:{}".format(file_path, stat.st_mtime_ns, stat.st_size).encode()
+            )
+        return fingerprint.hexdigest()
 
     def _set_unit_ip(self, _=None):
         """Set unit host address.
@@ -1669,10 +1841,13 @@ class MetricsEndpointProvider(Object):
                 unit_address = socket.getfqdn()
                 path = ""
 
-            relation.data[self._charm.unit]["prometheus_scrape_unit_address"] = unit_address
-            relation.data[self._charm.unit]["prometheus_scrape_unit_path"] = path
-            relation.data[self._charm.unit]["prometheus_scrape_unit_name"] = str(
-                self._charm.model.unit.name
+            _update_changed_relation_data(
+                relation.data[self._charm.unit],
+                {
+                    "prometheus_scrape_unit_address": unit_address,
+                    "prometheus_scrape_unit_path": path,
+                    "prometheus_scrape_unit_name": str(self._charm.model.unit.name),
+                },
             )
 
     def _is_valid_unit_address(self, address: str) -> bool:
@@ -1782,10 +1957,8 @@ class PrometheusRulesProvider(Object):
 
         logger.info("Updating relation data with rule files from disk")
         for relation in self._charm.model.relations[self._relation_name]:
-            relation.data[self._charm.app]["alert_rules"] = json.dumps(
-                alert_rules_as_dict,
-                sort_keys=True,  # sort, to prevent unnecessary relation_changed events
-            )
+            # canonical, to prevent unnecessary relation_changed events
+            relation.data[self._charm.app]["alert_rules"] = _canonical_json(alert_rules_as_dict)
 
 
 class MetricsEndpointAggregator(Object):
@@ -1908,10 +2081,26 @@ class MetricsEndpointAggregator(Object):
         self._alert_rules_relation = relation_names.get("alert_rules", "prometheus-rules")
 
         super().__init__(charm, self._prometheus_relation)
-        self._stored.set_default(jobs=[], alert_rules=[])
+        # `jobs_by_name` maps scrape job names to their JSON representation, and
+        # `alert_rule_groups` maps alert rule group names to the JSON representation of their
+        # rules keyed by rule hash, both in the order in which they are published. `jobs` and
+        # `alert_rules` are only kept to migrate data from older revisions.
+        self._stored.set_default(
+            jobs=[], jobs_by_name={}, alert_rules=[], alert_rule_groups={}, dns_names={}
+        )
+        if self._stored.jobs and not self._stored.jobs_by_name:
+            for job in _type_convert_stored(self._stored.jobs):
+                self._stored.jobs_by_name[job["job_name"]] = _canonical_json(job)
+            self._stored.jobs = []
+        if self._stored.alert_rules and not self._stored.alert_rule_groups:
+            for group in _type_convert_stored(self._stored.alert_rules):
+                self._store_alert_rules(group["name"], group.get("rules", []))
+            self._stored.alert_rules = []
 
         self._relabel_instance = relabel_instance
         self._resolve_addresses = resolve_addresses
+        # addresses whose lookup timed out, which are not tried again in the same hook
+        self._dns_lookups_timed_out = set()  # type: Set[str]
 
         # manage Prometheus charm relation events
         prometheus_events = self._charm.on[self._prometheus_relation]
@@ -1936,25 +2125,20 @@ class MetricsEndpointAggregator(Object):
         `MetricsEndpointAggregator`, that Prometheus unit is provided
         with the complete set of existing scrape jobs and alert rules.
         """
-        jobs = [] + _type_convert_stored(
-            self._stored.jobs
-        )  # list of scrape jobs, one per relation
         for relation in self.model.relations[self._target_relation]:
             targets = self._get_targets(relation)
             if targets and relation.app:
-                jobs.append(self._static_scrape_job(targets, relation.app.name))
+                self._store_job(self._static_scrape_job(targets, relation.app.name))
 
-        groups = [] + _type_convert_stored(self._stored.alert_rules)  # list of alert rule groups
         for relation in self.model.relations[self._alert_rules_relation]:
             unit_rules = self._get_alert_rules(relation)
             if unit_rules and relation.app:
                 appname = relation.app.name
                 rules = self._label_alert_rules(unit_rules, appname)
-                group = {"name": self.group_name(appname), "rules": rules}
-                groups.append(group)
+                self._store_alert_rules(self.group_name(appname), rules)
 
-        event.relation.data[self._charm.app]["scrape_jobs"] = json.dumps(jobs)
-        event.relation.data[self._charm.app]["alert_rules"] = json.dumps({"groups": groups})
+        event.relation.data[self._charm.app]["scrape_jobs"] = self._scrape_jobs_blob()
+        event.relation.data[self._charm.app]["alert_rules"] = self._alert_rules_blob()
 
     def _on_prometheus_targets_changed(self, event):
         """Update scrape jobs in response to scrape target changes.
@@ -1984,16 +2168,8 @@ class MetricsEndpointAggregator(Object):
         """
         # new scrape job for the relation that has changed
         updated_job = self._static_scrape_job(targets, app_name, **kwargs)
-
-        for relation in self.model.relations[self._prometheus_relation]:
-            jobs = json.loads(relation.data[self._charm.app].get("scrape_jobs", "[]"))
-            # list of scrape jobs that have not changed
-            jobs = [job for job in jobs if updated_job["job_name"] != job["job_name"]]
-            jobs.append(updated_job)
-            relation.data[self._charm.app]["scrape_jobs"] = json.dumps(jobs)
-
-            if not _type_convert_stored(self._stored.jobs) == jobs:
-                self._stored.jobs = jobs
+        self._store_job(updated_job)
+        self._publish_jobs()
 
     def _on_prometheus_targets_departed(self, event):
         """Remove scrape jobs when a target departs.
@@ -2015,34 +2191,50 @@ class MetricsEndpointAggregator(Object):
         For NRPE, the job name is calculated from an ID sent via the NRPE relation, and is
         sufficient to uniquely identify the target.
         """
-        for relation in self.model.relations[self._prometheus_relation]:
-            jobs = json.loads(relation.data[self._charm.app].get("scrape_jobs", "[]"))
-            if not jobs:
-                continue
+        stored_job = self._stored.jobs_by_name.get(job_name)
+        if stored_job is None:
+            return
 
-            changed_job = [j for j in jobs if j.get("job_name") == job_name]
-            if not changed_job:
-                continue
-            changed_job = changed_job[0]
+        changed_job = json.loads(stored_job)
+        del self._stored.jobs_by_name[job_name]
 
-            # list of scrape jobs that have not changed
-            jobs = [job for job in jobs if job.get("job_name") != job_name]
+        # list of scrape jobs for units of the same application that still exist
+        configs_kept = [
+            config
+            for config in changed_job["static_configs"]
+            if config.get("labels", {}).get("juju_unit") != unit_name
+        ]
 
-            # list of scrape jobs for units of the same application that still exist
-            configs_kept = [
-                config
-                for config in changed_job["static_configs"]  # type: ignore
-                if config.get("labels", {}).get("juju_unit") != unit_name
-            ]
+        if configs_kept:
+            changed_job["static_configs"] = configs_kept
+            self._store_job(changed_job)
+
+        self._publish_jobs()
+
+    def _store_job(self, job: dict) -> None:
+        """Add or replace a scrape job in the job index, moving it to the end of the list.
+
+        Args:
+            job: a Prometheus scrape job.
+        """
+        job_name = job["job_name"]
+        if job_name in self._stored.jobs_by_name:
+            del self._stored.jobs_by_name[job_name]
+        self._stored.jobs_by_name[job_name] = _canonical_json(job)
 
-            if configs_kept:
-                changed_job["static_configs"] = configs_kept  # type: ignore
-                jobs.append(changed_job)
+    def _scrape_jobs_blob(self) -> str:
+        """Returns the JSON list of all indexed scrape jobs.
 
-            relation.data[self._charm.app]["scrape_jobs"] = json.dumps(jobs)
+        Jobs are kept serialised in the index, so the list is assembled without encoding any
+        job again. The result is identical to `_canonical_json` of the list of jobs.
+        """
+        return "[{}]".format(",".join(self._stored.jobs_by_name.values()))
 
-            if not _type_convert_stored(self._stored.jobs) == jobs:
-                self._stored.jobs = jobs
+    def _publish_jobs(self) -> None:
+        """Write the indexed scrape jobs to every Prometheus relation."""
+        data = {"scrape_jobs": self._scrape_jobs_blob()}
+        for relation in self.model.relations[self._prometheus_relation]:
+            _update_changed_relation_data(relation.data[self._charm.app], data)
 
     def _job_name(self, appname) -> str:
         """Construct a scrape job name.
@@ -2110,6 +2302,10 @@ class MetricsEndpointAggregator(Object):
         juju_model = self.model.name
         juju_model_uuid = self.model.uuid
 
+        if self._resolve_addresses:
+            # resolve all targets at once, so that per target lookups hit the cache
+            self._resolve_dns_names([target["hostname"] for target in targets.values()])
+
         job = {
             "job_name": self._job_name(application_name),
             "static_configs": [
@@ -2137,15 +2333,45 @@ class MetricsEndpointAggregator(Object):
         extra_info = {}
 
         if self._resolve_addresses:
-            try:
-                dns_name = socket.gethostbyaddr(target["hostname"])[0]
-            except OSError:
-                logger.debug("Could not perform DNS lookup for %s", target["hostname"])
-                dns_name = target["hostname"]
-            extra_info["dns_name"] = dns_name
+            hostname = target["hostname"]
+            extra_info["dns_name"] = self._resolve_dns_names([hostname]).get(hostname, hostname)
 
         return extra_info
 
+    def _resolve_dns_names(self, hostnames: List[str]) -> Dict[str, str]:
+        """Resolve the DNS names of target addresses, caching the results in `StoredState`.
+
+        Cached names are reused for `DNS_CACHE_TTL` seconds. The remaining addresses are
+        looked up concurrently within `DNS_LOOKUP_TIMEOUT` seconds. Lookups that did not
+        complete in time are not cached, so that they are tried again in the next hook.
+
+        Args:
+            hostnames: addresses of scrape targets.
+
+        Returns:
+            a dictionary mapping addresses to DNS names, for the addresses that were resolved.
+        """
+        now = time.time()
+        cache = self._stored.dns_names
+        missing = [
+            h
+            for h in hostnames
+            if (h not in cache or cache[h]["expires"] <= now)
+            and h not in self._dns_lookups_timed_out
+        ]
+        if missing:
+            # drop expired entries, including those of targets that are gone
+            for hostname in [h for h, entry in cache.items() if entry["expires"] <= now]:
+                del cache[hostname]
+            resolved = _reverse_lookup_all(missing, DNS_LOOKUP_TIMEOUT, DNS_LOOKUP_MAX_WORKERS)
+            for hostname, dns_name in resolved.items():
+                cache[hostname] = {"dns_name": dns_name, "expires": now + DNS_CACHE_TTL}
+            self._dns_lookups_timed_out.update(set(missing) - set(resolved))
+
+        return {
+            hostname: cache[hostname]["dns_name"] for hostname in hostnames if hostname in cache
+        }
+
     @property
     def _relabel_configs(self) -> list:
         """Create Juju topology relabeling configuration.
@@ -2199,23 +2425,9 @@ class MetricsEndpointAggregator(Object):
             rules = self._label_alert_rules(unit_rules, name)
         else:
             rules = [unit_rules]
-        updated_group = {"name": self.group_name(name), "rules": rules}
-
-        for relation in self.model.relations[self._prometheus_relation]:
-            alert_rules = json.loads(relation.data[self._charm.app].get("alert_rules", "{}"))
-            groups = alert_rules.get("groups", [])
-            # list of alert rule groups that have not changed
-            for group in groups:
-                if group["name"] == updated_group["name"]:
-                    group["rules"] = [r for r in group["rules"] if r not in updated_group["rules"]]
-                    group["rules"].extend(updated_group["rules"])
-
-            if updated_group["name"] not in [g["name"] for g in groups]:
-                groups.append(updated_group)
-            relation.data[self._charm.app]["alert_rules"] = json.dumps({"groups": groups})
 
-            if not _type_convert_stored(self._stored.alert_rules) == groups:
-                self._stored.alert_rules = groups
+        self._store_alert_rules(self.group_name(name), rules)
+        self._publish_alert_rules()
 
     def _on_alert_rules_departed(self, event):
         """Remove alert rules for departed targets.
@@ -2229,40 +2441,63 @@ class MetricsEndpointAggregator(Object):
 
     def remove_alert_rules(self, group_name: str, unit_name: str) -> None:
         """Remove an alert rule group from relation data."""
-        for relation in self.model.relations[self._prometheus_relation]:
-            alert_rules = json.loads(relation.data[self._charm.app].get("alert_rules", "{}"))
-            if not alert_rules:
-                continue
+        group = self._stored.alert_rule_groups.get(group_name)
+        if group is None:
+            return
 
-            groups = alert_rules.get("groups", [])
-            if not groups:
-                continue
+        # alert rules associated with departing unit
+        departed = [
+            rule_hash
+            for rule_hash, rule in group.items()
+            if json.loads(rule).get("labels").get("juju_unit") == unit_name
+        ]
+        for rule_hash in departed:
+            del group[rule_hash]
 
-            changed_group = [group for group in groups if group["name"] == group_name]
-            if not changed_group:
-                continue
-            changed_group = changed_group[0]
+        if not group:
+            del self._stored.alert_rule_groups[group_name]
 
-            # list of alert rule groups that have not changed
-            groups = [group for group in groups if group["name"] != group_name]
+        self._publish_alert_rules()
 
-            # list of alert rules not associated with departing unit
-            rules_kept = [
-                rule
-                for rule in changed_group.get("rules")  # type: ignore
-                if rule.get("labels").get("juju_unit") != unit_name
-            ]
+    def _store_alert_rules(self, group_name: str, rules: list) -> None:
+        """Add or replace alert rules of a group in the alert rule index.
 
-            if rules_kept:
-                changed_group["rules"] = rules_kept  # type: ignore
-                groups.append(changed_group)
+        Rules are identified by a hash of their content, so storing a rule that is already in
+        the group moves it to the end of the group instead of duplicating it.
 
-            relation.data[self._charm.app]["alert_rules"] = (
-                json.dumps({"groups": groups}) if groups else "{}"
-            )
+        Args:
+            group_name: name of the alert rule group.
+            rules: a list of alert rules, where each rule is in dictionary format.
+        """
+        if group_name not in self._stored.alert_rule_groups:
+            self._stored.alert_rule_groups[group_name] = {}
+        group = self._stored.alert_rule_groups[group_name]
+        for rule in rules:
+            rule_json = _canonical_json(rule)
+            rule_hash = hashlib.sha256(rule_json.encode()).hexdigest()
+            if rule_hash in group:
+                del group[rule_hash]
+            group[rule_hash] = rule_json
+
+    def _alert_rules_blob(self) -> str:
+        """Returns the JSON representation of all indexed alert rule groups.
+
+        Rules are kept serialised in the index, so the groups are assembled without encoding
+        any rule again. The result is identical to `_canonical_json` of the alert rule groups.
+        """
+        if not self._stored.alert_rule_groups:
+            return "{}"
+        groups = ",".join(
+            '{{"name":{},"rules":[{}]}}'.format(_canonical_json(name), ",".join(rules.values()))
+            for name, rules in self._stored.alert_rule_groups.items()
+        )
+        return '{{"groups":[{}]}}'.format(groups)
 
-            if not _type_convert_stored(self._stored.alert_rules) == groups:
-                self._stored.alert_rules = groups
+    def _publish_alert_rules(self) -> None:
+        """Write the indexed alert rule groups to every Prometheus relation."""
+        data = {"alert_rules": self._alert_rules_blob()}
+        for relation in self.model.relations[self._prometheus_relation]:
+            _update_changed_relation_data(relation.data[self._charm.app], data)
 
     def _get_alert_rules(self, relation) -> dict:
         """Fetch alert rules for a relation.
@@ -2334,11 +2569,193 @@ class MetricsEndpointAggregator(Object):
         return labeled_rules
 
 
+class PromQLParseError(ValueError):
+    """Raised if a PromQL expression cannot be tokenized."""
+
+
+_PROMQL_KEYWORDS = {
+    "and",
+    "or",
+    "unless",
+    "atan2",
+    "bool",
+    "offset",
+    "by",
+    "without",
+    "on",
+    "ignoring",
+    "group_left",
+    "group_right",
+}
+_PROMQL_GROUPING_KEYWORDS = {"by", "without", "on", "ignoring", "group_left", "group_right"}
+_PROMQL_NUMBER_LITERALS = {"inf", "nan"}
+_PROMQL_IDENTIFIER = re.compile(r"[a-zA-Z_:][a-zA-Z0-9_:]*")
+_PROMQL_NUMBER = re.compile(
+    r"0[xX][0-9a-fA-F]+|(?:[0-9]+(?:ms|[smhdwy]))+|(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?:[eE][-+]?[0-9]+)?"
+)
+_PROMQL_STRING = re.compile(r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'|`[^`]*`')
+_PROMQL_MATCHER_LABEL = re.compile(r"([a-zA-Z_][a-zA-Z0-9_]*)\s*(?:=~|!~|!=|=)")
+
+
+def _promql_string_end(expression: str, start: int) -> int:
+    """Returns the index following the string literal starting at `start`."""
+    match = _PROMQL_STRING.match(expression, start)
+    if not match:
+        raise PromQLParseError("unterminated string at position {}".format(start))
+    return match.end()
+
+
+def _promql_closing_index(expression: str, start: int, closing: str) -> int:
+    """Returns the index of the `closing` character matching the opening one at `start`."""
+    index = start + 1
+    while index < len(expression):
+        char = expression[index]
+        if char in "\"'`":
+            index = _promql_string_end(expression, index)
+            continue
+        if char == closing:
+            return index
+        index += 1
+    raise PromQLParseError("missing '{}' for position {}".format(closing, start))
+
+
+def _promql_split_matchers(block: str) -> List[str]:
+    """Splits the content of a selector block into its label matchers."""
+    parts = []
+    start = index = 0
+    while index < len(block):
+        char = block[index]
+        if char in "\"'`":
+            index = _promql_string_end(block, index)
+            continue
+        if char == ",":
+            parts.append(block[start:index])
+            start = index + 1
+        index += 1
+    parts.append(block[start:])
+    return [part.strip() for part in parts if part.strip()]
+
+
+def _promql_merge_matchers(block: str, matchers: Dict[str, str]) -> str:
+    """Adds label matchers to the content of a selector block.
+
+    Existing matchers of the injected labels are replaced, as cos-tool does.
+    """
+    kept = []
+    for part in _promql_split_matchers(block):
+        label = _PROMQL_MATCHER_LABEL.match(part)
+        if label and label.group(1) in matchers:
+            continue
+        kept.append(part)
+    added = [
+        '{}="{}"'.format(
+            name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        )
+        for name, value in matchers.items()
+    ]
+    return "{" + ",".join(kept + added) + "}"
+
+
+def _promql_inject_label_matchers(expression: str, matchers: Dict[str, str]) -> str:
+    """Insert label matchers into every vector selector of a PromQL expression.
+
+    The expression is tokenized just enough to tell vector selectors apart from function
+    names, keywords, grouping label lists, strings, numbers and durations. Everything but
+    the selectors is copied over unchanged. Matchers a selector already has for the injected
+    labels are replaced, so that `up{juju_model="z"}` only matches the injected model, as
+    with `cos-tool transform`.
+
+    Args:
+        expression: a PromQL expression.
+        matchers: a mapping of label names to the values they must equal.
+
+    Returns:
+        the expression with the label matchers injected.
+
+    Raises:
+        PromQLParseError: if the expression has unterminated strings, brackets or braces.
+    """
+    result = []
+    grouping = False
+    index = 0
+    length = len(expression)
+    while index < length:
+        char = expression[index]
+        if char.isspace():
+            result.append(char)
+            index += 1
+            continue
+        if char == "#":
+            end = expression.find("\n", index)
+            end = length if end == -1 else end
+        elif char in "\"'`":
+            end = _promql_string_end(expression, index)
+        elif char == "[":
+            # range or subquery durations, which never contain selectors
+            end = _promql_closing_index(expression, index, "]") + 1
+        elif char == "(" and grouping:
+            # label list of a grouping or vector matching modifier
+            end = _promql_closing_index(expression, index, ")") + 1
+        elif char == "{":
+            end = _promql_closing_index(expression, index, "}") + 1
+            result.append(_promql_merge_matchers(expression[index + 1 : end - 1], matchers))
+            index = end
+            grouping = False
+            continue
+        elif char.isdigit() or (char == "." and expression[index + 1 : index + 2].isdigit()):
+            end = _PROMQL_NUMBER.match(expression, index).end()  # type: ignore[union-attr]
+        elif _PROMQL_IDENTIFIER.match(expression, index):
+            end = _PROMQL_IDENTIFIER.match(expression, index).end()  # type: ignore[union-attr]
+            word = expression[index:end]
+            lookahead = end
+            while lookahead < length and expression[lookahead].isspace():
+                lookahead += 1
+            next_char = expression[lookahead : lookahead + 1]
+            next_word = _PROMQL_IDENTIFIER.match(expression, lookahead)
+            # functions, and aggregation operators possibly followed by their grouping clause
+            is_call = next_char == "(" or bool(
+                next_word and next_word.group().lower() in ("by", "without")
+            )
+            if word.lower() in _PROMQL_KEYWORDS:
+                result.append(word)
+                index = end
+                grouping = word.lower() in _PROMQL_GROUPING_KEYWORDS
+                continue
+            if word.lower() not in _PROMQL_NUMBER_LITERALS and not is_call:
+                # a metric name, starting a vector selector
+                if next_char == "{":
+                    end = _promql_closing_index(expression, lookahead, "}") + 1
+                    block = expression[lookahead + 1 : end - 1]
+                else:
+                    block = ""
+                result.append(word + _promql_merge_matchers(block, matchers))
+                index = end
+                grouping = False
+                continue
+        else:
+            end = index + 1
+        result.append(expression[index:end])
+        index = end
+        grouping = False
+    return "".join(result)
+
+
 class CosTool:
-    """Uses cos-tool to inject label matchers into alert rule expressions and validate rules."""
+    """Injects label matchers into alert rule expressions and uses cos-tool to validate rules.
+
+    Label matchers are injected in-process. `cos-tool` is only used for expressions that
+    cannot be tokenized in-process.
+    """
 
     _path = None
     _disabled = False
+    # Maximum number of cos-tool processes running at once when transforming a batch.
+    _max_processes = 16
+    # Validation results, keyed by the SHA-256 of the rules and of the cos-tool binary.
+    _validation_cache = {}  # type: Dict[str, Tuple[bool, str]]
+    _validation_cache_dir = ".cos-tool-validation-cache"
+    # Maximum number of validation results kept on disk, the least recently used are evicted.
+    _validation_cache_size = 128
 
     def __init__(self, charm):
         self._charm = charm
@@ -2357,33 +2774,103 @@ class CosTool:
 
     def apply_label_matchers(self, rules) -> dict:
         """Will apply label matchers to the expression of all alerts in all supplied groups."""
-        if not self.path:
-            return rules
-        for group in rules["groups"]:
-            rules_in_group = group.get("rules", [])
-            for rule in rules_in_group:
-                topology = {}
-                # if the user for some reason has provided juju_unit, we'll need to honor it
-                # in most cases, however, this will be empty
-                for label in [
-                    "juju_model",
-                    "juju_model_uuid",
-                    "juju_application",
-                    "juju_charm",
-                    "juju_unit",
-                ]:
-                    if label in rule["labels"]:
-                        topology[label] = rule["labels"][label]
-
-                rule["expr"] = self.inject_label_matchers(rule["expr"], topology)
+        alert_rules = [rule for group in rules["groups"] for rule in group.get("rules", [])]
+        expressions = []
+        for rule in alert_rules:
+            topology = {}
+            # if the user for some reason has provided juju_unit, we'll need to honor it
+            # in most cases, however, this will be empty
+            for label in [
+                "juju_model",
+                "juju_model_uuid",
+                "juju_application",
+                "juju_charm",
+                "juju_unit",
+            ]:
+                if label in rule["labels"]:
+                    topology[label] = rule["labels"][label]
+            expressions.append((rule["expr"], topology))
+
+        for rule, expression in zip(alert_rules, self.inject_label_matchers_batch(expressions)):
+            rule["expr"] = expression
         return rules
 
     def validate_alert_rules(self, rules: dict) -> Tuple[bool, str]:
-        """Will validate correctness of alert rules, returning a boolean and any errors."""
+        """Will validate correctness of alert rules, returning a boolean and any errors.
+
+        Results are cached in memory and, when a charm is given, on disk under the charm
+        directory, so that rules that were already validated are not validated again.
+        """
         if not self.path:
             logger.debug("`cos-tool` unavailable. Not validating alert correctness.")
             return True, ""
 
+        digest = self._validation_digest(rules)
+        cached = self._cached_validation(digest)
+        if cached is not None:
+            return cached
+
+        valid, errors = self._validate_alert_rules(rules)
+        self._cache_validation(digest, valid, errors)
+        return valid, errors
+
+    def _validation_digest(self, rules: dict) -> str:
+        """SHA-256 of the rules and of the cos-tool binary validating them."""
+        digest = hashlib.sha256(_canonical_json(rules).encode())
+        try:
+            stat = self.path.stat()  # type: ignore[union-attr]
+            digest.update("{}:{}:{}".format(self.path, stat.st_mtime_ns, stat.st_size).encode())
+        except OSError:
+            digest.update(str(self.path).encode())
+        return digest.hexdigest()
+
+    @property
+    def _validation_cache_path(self) -> Optional[Path]:
+        if not self._charm:
+            return None
+        return Path(str(self._charm.charm_dir)) / self._validation_cache_dir
+
+    def _cached_validation(self, digest: str) -> Optional[Tuple[bool, str]]:
+        """Look up a validation result in memory, then on disk."""
+        if digest in CosTool._validation_cache:
+            return CosTool._validation_cache[digest]
+        cache_path = self._validation_cache_path
+        if not cache_path:
+            return None
+        try:
+            cached = json.loads((cache_path / digest).read_text())
+        except (OSError, ValueError):
+            return None
+        try:
+            # the modification time orders entries for eviction
+            (cache_path / digest).touch()
+        except OSError as e:
+            logger.debug("Could not refresh alert rules validation result: %s", e)
+        result = (bool(cached["valid"]), str(cached["errors"]))
+        CosTool._validation_cache[digest] = result
+        return result
+
+    def _cache_validation(self, digest: str, valid: bool, errors: str) -> None:
+        """Store a validation result in memory and on disk."""
+        CosTool._validation_cache[digest] = (valid, errors)
+        cache_path = self._validation_cache_path
+        if not cache_path:
+            return
+        try:
+            cache_path.mkdir(exist_ok=True)
+            (cache_path / digest).write_text(_canonical_json({"valid": valid, "errors": errors}))
+            self._evict_validations(cache_path)
+        except OSError as e:
+            logger.debug("Could not store alert rules validation result: %s", e)
+
+    def _evict_validations(self, cache_path: Path) -> None:
+        """Remove the least recently used validation results beyond the cache size."""
+        entries = sorted(cache_path.iterdir(), key=lambda entry: entry.stat().st_mtime_ns)
+        for entry in entries[: max(len(entries) - self._validation_cache_size, 0)]:
+            entry.unlink()
+
+    def _validate_alert_rules(self, rules: dict) -> Tuple[bool, str]:
+        """Validate alert rules with cos-tool."""
         with tempfile.TemporaryDirectory() as tmpdir:
             rule_path = Path(tmpdir + "/validate_rule.yaml")
             rule_path.write_text(yaml.dump(rules))
@@ -2407,22 +2894,91 @@ class CosTool:
         """Add label matchers to an expression."""
         if not topology:
             return expression
+        try:
+            return _promql_inject_label_matchers(expression, topology)
+        except PromQLParseError as e:
+            logger.debug("Falling back to cos-tool to transform %s: %s", expression, e)
         if not self.path:
             logger.debug("`cos-tool` unavailable. Leaving expression unchanged: %s", expression)
             return expression
-        args = [str(self.path), "transform"]
-        args.extend(
-            ["--label-matcher={}={}".format(key, value) for key, value in topology.items()]
-        )
-
-        args.extend(["{}".format(expression)])
+        args = self._transform_args(expression, topology)
         # noinspection PyBroadException
         try:
             return self._exec(args)
-        except subprocess.CalledProcessError as e:
+        except (subprocess.CalledProcessError, OSError) as e:
             logger.debug('Applying the expression failed: "%s", falling back to the original', e)
             return expression
 
+    def inject_label_matchers_batch(self, expressions: List[Tuple[str, dict]]) -> List[str]:
+        """Add label matchers to many expressions at once.
+
+        Expressions are transformed in-process. `cos-tool transform` takes a single expression,
+        so identical expression and topology pairs the in-process injector could not handle are
+        transformed only once, by concurrent `cos-tool` processes.
+
+        Args:
+            expressions: a list of (expression, topology) tuples.
+
+        Returns:
+            the list of transformed expressions, in the same order. Expressions that could
+            not be transformed are returned unchanged.
+        """
+        keys = [self._batch_key(expression, topology) for expression, topology in expressions]
+        pending = {
+            key: (expression, topology)
+            for key, (expression, topology) in zip(keys, expressions)
+            if topology
+        }
+        transformed = {}  # type: Dict[tuple, str]
+        for key, (expression, topology) in pending.items():
+            try:
+                transformed[key] = _promql_inject_label_matchers(expression, topology)
+            except PromQLParseError as e:
+                logger.debug("Falling back to cos-tool to transform %s: %s", expression, e)
+
+        pending_keys = [key for key in pending if key not in transformed]
+        if pending_keys and not self.path:
+            logger.debug("`cos-tool` unavailable. Leaving expressions unchanged.")
+            pending_keys = []
+        for start in range(0, len(pending_keys), self._max_processes):
+            processes = []
+            for key in pending_keys[start : start + self._max_processes]:
+                try:
+                    process = subprocess.Popen(
+                        self._transform_args(*pending[key]),
+                        stdout=subprocess.PIPE,
+                        stderr=subprocess.STDOUT,
+                    )
+                except OSError as e:
+                    logger.debug("Running `cos-tool` failed: %s, falling back to the original", e)
+                    continue
+                processes.append((key, process))
+            for key, process in processes:
+                output, _ = process.communicate()
+                if process.returncode == 0:
+                    transformed[key] = output.decode("utf-8").strip()
+                else:
+                    logger.debug(
+                        'Applying the expression failed: "%s", falling back to the original',
+                        output.decode("utf-8").strip(),
+                    )
+
+        return [
+            transformed.get(key, expression) for key, (expression, _) in zip(keys, expressions)
+        ]
+
+    @staticmethod
+    def _batch_key(expression: str, topology: dict) -> tuple:
+        return expression, tuple(sorted(topology.items()))
+
+    def _transform_args(self, expression: str, topology: dict) -> List[str]:
+        args = [str(self.path), "transform"]
+        args.extend(
+            ["--label-matcher={}={}".format(key, value) for key, value in topology.items()]
+        )
+        args.extend(["{}".format(expression)])
+        return args
+
     def _get_tool_path(self) -> Optional[Path]:
         arch = platform.machine()
         arch = "amd64" if arch == "x86_64" else arch
@@ -5,21 +5,36 @@
 """Charmed operator for the 5G SMF service."""
 
 import logging
-from ipaddress import IPv4Address
+import re
+import time
+from ipaddress import IPv4Address, IPv4Interface
 from subprocess import check_output
-from typing import Dict, Optional, Union
+from typing import Dict, List, Optional, Tuple, Union
 
-from charms.data_platform_libs.v0.data_interfaces import DatabaseCreatedEvent, DatabaseRequires
+from charms.data_platform_libs.v0.data_interfaces import DatabaseReadyEvent, DatabaseRequires
 from charms.nrf_operator.v0.nrf import NRFAvailableEvent, NRFRequires
 from charms.observability_libs.v1.kubernetes_service_patch import KubernetesServicePatch
 from charms.prometheus_k8s.v0.prometheus_scrape import MetricsEndpointProvider
 from jinja2 import Environment, FileSystemLoader
-from lightkube.models.core_v1 import ServicePort
-from ops.charm import CharmBase, InstallEvent, PebbleReadyEvent
+from lightkube.models.core_v1 import ResourceRequirements, ServicePort
+from lightkube.utils.quantity import parse_quantity
+from ops.charm import (
+    ActionEvent,
+    CharmBase,
+    ConfigChangedEvent,
+    InstallEvent,
+    PebbleReadyEvent,
+    UpdateStatusEvent,
+)
+from ops.framework import StoredState
 from ops.main import main
-from ops.model import ActiveStatus, BlockedStatus, WaitingStatus
+from ops.model import ActiveStatus, BlockedStatus, Relation, Unit, WaitingStatus
 from ops.pebble import Layer
 
+from kubernetes_compute_resources import KubernetesComputeResourcesPatch
+from kubernetes_multus import KubernetesMultus
+from smf_metrics import SMFMetrics, fetch_metrics
+
 logger = logging.getLogger(__name__)
 
 BASE_CONFIG_PATH = "/etc/smf"
@@ -29,40 +44,64 @@ DEFAULT_DATABASE_NAME = "free5gc"
 SMF_DATABASE_NAME = "sdcore_smf"
 PFCP_PORT = 8805
 PROMETHEUS_PORT = 9089
+METRICS_SCRAPE_TIMEOUT = 2
+PEER_RELATION_NAME = "replicas"
+# Containers Juju adds to the pod, which need resources too for the pod to be Guaranteed QoS
+JUJU_CHARM_CONTAINERS = ["charm", "charm-init"]
+JUJU_CHARM_CONTAINER_RESOURCES = {"cpu": "250m", "memory": "256Mi"}
+PFCP_SERVICE_TYPES = ["LoadBalancer", "NodePort"]
+PFCP_INTERFACE_NAME = "n4"
+PROMETHEUS_DURATION_PATTERN = re.compile(r"^(?:[0-9]+(?:ms|[smhdwy]))+$")
+PROMETHEUS_DURATION_UNITS = {
+    "ms": 0.001,
+    "s": 1,
+    "m": 60,
+    "h": 3600,
+    "d": 86400,
+    "w": 604800,
+    "y": 31536000,
+}
 
 
 class SMFOperatorCharm(CharmBase):
     """Main class to describe juju event handling for the 5G SMF operator."""
 
+    _stored = StoredState()
+
     def __init__(self, *args):
         super().__init__(*args)
+        self._stored.set_default(n11_messages=0.0, n11_failures=0.0, metrics_timestamp=0.0)
         self._container_name = self._service_name = "smf"
         self._container = self.unit.get_container(self._container_name)
         self._default_database = DatabaseRequires(
-            self, relation_name="default-database", database_name=DEFAULT_DATABASE_NAME
+            self,
+            relation_name="default-database",
+            database_name=DEFAULT_DATABASE_NAME,
+            coalesce_events=True,
         )
         self._smf_database = DatabaseRequires(
-            self, relation_name="smf-database", database_name=SMF_DATABASE_NAME
+            self,
+            relation_name="smf-database",
+            database_name=SMF_DATABASE_NAME,
+            coalesce_events=True,
         )
         self._nrf_requires = NRFRequires(charm=self, relationship_name="nrf")
         self.framework.observe(self.on.install, self._on_install)
         self.framework.observe(self.on.smf_pebble_ready, self._on_smf_pebble_ready)
+        self.framework.observe(self.on.config_changed, self._on_smf_pebble_ready)
+        self.framework.observe(self.on.update_status, self._on_update_status)
+        self.framework.observe(self.on.get_load_score_action, self._on_get_load_score_action)
         self.framework.observe(self.on.default_database_relation_joined, self._on_smf_pebble_ready)
         self.framework.observe(self.on.smf_database_relation_joined, self._on_smf_pebble_ready)
         self.framework.observe(self.on.nrf_relation_joined, self._on_smf_pebble_ready)
-        self.framework.observe(
-            self._default_database.on.database_created, self._on_smf_pebble_ready
-        )
-        self.framework.observe(self._smf_database.on.database_created, self._on_smf_pebble_ready)
+        self.framework.observe(self._default_database.on.database_ready, self._on_smf_pebble_ready)
+        self.framework.observe(self._smf_database.on.database_ready, self._on_smf_pebble_ready)
         self.framework.observe(self._nrf_requires.on.nrf_available, self._on_smf_pebble_ready)
         self._metrics_endpoint = MetricsEndpointProvider(
             self,
-            jobs=[
-                {
-                    "static_configs": [{"targets": [f"*:{PROMETHEUS_PORT}"]}],
-                }
-            ],
+            jobs=[self._metrics_job],
         )
+        self.framework.observe(self.on.config_changed, self._update_metrics_job)
         self._service_patcher = KubernetesServicePatch(
             charm=self,
             ports=[
@@ -70,6 +109,41 @@ class SMFOperatorCharm(CharmBase):
                 ServicePort(name="prometheus-exporter", port=PROMETHEUS_PORT),
                 ServicePort(name="sbi", port=29502),
             ],
+            server_side_apply=True,
+        )
+        # The PFCP service and the Multus network are left as they are while the config is
+        # invalid: the API server would reject the service (e.g. a ClusterIP service with an
+        # external traffic policy) and the network would be detached from the pod, restarting it.
+        # The PFCP service is not managed while PFCP is bound to the Multus network, as it would
+        # forward to the pod's primary interface.
+        if not self._invalid_config_message:
+            pfcp_interface_master, pfcp_interface_ip = self._pfcp_interface
+            if not pfcp_interface_ip:
+                self._pfcp_service_patcher = KubernetesServicePatch(
+                    charm=self,
+                    ports=[ServicePort(name="pfcp", port=PFCP_PORT, protocol="UDP")],
+                    service_name=f"{self.app.name}-pfcp",
+                    service_type=self._pfcp_service_type,
+                    additional_annotations=self._pfcp_service_annotations,
+                    refresh_event=self.on.config_changed,
+                    server_side_apply=True,
+                    external_traffic_policy="Local",
+                    session_affinity="ClientIP",
+                )
+            self._pfcp_network = KubernetesMultus(
+                charm=self,
+                network_attachment_definition_name=f"{self.app.name}-n4",
+                interface_name=PFCP_INTERFACE_NAME,
+                master=pfcp_interface_master,
+                ip=pfcp_interface_ip,
+                refresh_event=self.on.config_changed,
+            )
+        # The Multus network and the compute resources are patched separately, so changing both
+        # in one config change rolls the StatefulSet out, and restarts the pod, twice.
+        self._compute_resources_patch = KubernetesComputeResourcesPatch(
+            charm=self,
+            resource_requirements=self._resource_requirements,
+            refresh_event=self.on.config_changed,
         )
 
     def _on_install(self, event: InstallEvent) -> None:
@@ -79,19 +153,189 @@ class SMFOperatorCharm(CharmBase):
             return
         self._write_uerouting_config_file()
 
-    def _write_config_file(self, database_url: str, nrf_url: str) -> None:
+    def _on_update_status(self, event: UpdateStatusEvent) -> None:
+        """Summarises the workload metrics in the status of an active unit."""
+        if not isinstance(self.unit.status, ActiveStatus):
+            return
+        metrics = fetch_metrics(
+            url=f"http://localhost:{PROMETHEUS_PORT}/metrics", timeout=METRICS_SCRAPE_TIMEOUT
+        )
+        if not metrics:
+            return
+        messages, failures, seconds = self._n11_message_deltas(metrics)
+        request_rate = messages / seconds if seconds else 0.0
+        self._publish_load_score(self._load_score(metrics.pdu_sessions, request_rate))
+        error_rate = failures / messages if messages else 0.0
+        self.unit.status = ActiveStatus(
+            f"{int(metrics.pdu_sessions)} PDU sessions, {len(metrics.upfs)} UPFs, "
+            f"{error_rate:.1%} N11 errors"
+        )
+
+    def _n11_message_deltas(self, metrics: SMFMetrics) -> Tuple[float, float, float]:
+        """Returns the N11 requests and failures received since the previous scrape.
+
+        Args:
+            metrics (SMFMetrics): The workload metrics.
+
+        Returns:
+            Tuple[float, float, float]: The number of requests, the number of failures and the
+                number of seconds elapsed since the previous scrape, 0 for the first one.
+        """
+        now = time.time()
+        messages = metrics.n11_messages - self._stored.n11_messages
+        failures = metrics.n11_failures - self._stored.n11_failures
+        if messages < 0 or failures < 0:
+            # counters were reset by a restart of the workload
+            messages, failures = metrics.n11_messages, metrics.n11_failures
+        seconds = now - self._stored.metrics_timestamp if self._stored.metrics_timestamp else 0.0
+        self._stored.n11_messages = metrics.n11_messages
+        self._stored.n11_failures = metrics.n11_failures
+        self._stored.metrics_timestamp = now
+        return messages, failures, seconds
+
+    def _load_score(self, pdu_sessions: float, request_rate: float) -> float:
+        """Returns the load score of the unit.
+
+        The score is the highest of the PDU session and SBI request rate utilisations of the
+        capacities configured for a unit, 1.0 meaning that the unit is at capacity.
+
+        Args:
+            pdu_sessions (float): Number of PDU sessions handled by the unit.
+            request_rate (float): Rate of SBI (N11) requests received by the unit, per second.
+
+        Returns:
+            float: The load score.
+        """
+        return max(
+            pdu_sessions / self.model.config["load-session-capacity"],
+            request_rate / self.model.config["load-request-rate-capacity"],
+        )
+
+    def _load_recommendation(self, load_score: float) -> str:
+        """Returns the scaling recommendation for a load score.
+
+        Args:
+            load_score (float): The load score.
+
+        Returns:
+            str: "scale-out", "scale-in" or "hold".
+        """
+        if load_score >= self.model.config["load-scale-out-threshold"]:
+            return "scale-out"
+        if load_score < self.model.config["load-scale-in-threshold"]:
+            return "scale-in"
+        return "hold"
+
+    def _publish_load_score(self, load_score: float) -> None:
+        """Publishes the load score of the unit on the peer relation.
+
+        The leader also publishes the average load score of the application in the application
+        data bag, for autoscalers to act upon.
+
+        Args:
+            load_score (float): The load score of the unit.
+        """
+        relation = self.model.get_relation(PEER_RELATION_NAME)
+        if not relation:
+            return
+        relation.data[self.unit].update(
+            {
+                "load-score": f"{load_score:.3f}",
+                "load-recommendation": self._load_recommendation(load_score),
+            }
+        )
+        if not self.unit.is_leader():
+            return
+        application_load_score = self._application_load_score(relation)
+        if application_load_score is None:
+            return
+        relation.data[self.app].update(
+            {
+                "load-score": f"{application_load_score:.3f}",
+                "load-recommendation": self._load_recommendation(application_load_score),
+            }
+        )
+
+    def _unit_load_scores(self, relation: Relation) -> Dict[Unit, float]:
+        """Returns the load scores published by the units of the application.
+
+        Args:
+            relation (Relation): The peer relation.
+
+        Returns:
+            Dict[Unit, float]: The load scores of the units which published one.
+        """
+        return {
+            unit: float(relation.data[unit]["load-score"])
+            for unit in [self.unit, *relation.units]
+            if relation.data[unit].get("load-score")
+        }
+
+    def _application_load_score(self, relation: Relation) -> Optional[float]:
+        """Returns the average load score of the units of the application.
+
+        Args:
+            relation (Relation): The peer relation.
+
+        Returns:
+            float: The average load score, None if no unit published one.
+        """
+        scores = list(self._unit_load_scores(relation).values())
+        if not scores:
+            return None
+        return sum(scores) / len(scores)
+
+    def _on_get_load_score_action(self, event: ActionEvent) -> None:
+        """Returns the load scores of the units and of the application."""
+        relation = self.model.get_relation(PEER_RELATION_NAME)
+        if not relation:
+            event.fail("Peer relation is not created yet")
+            return
+        application_load_score = self._application_load_score(relation)
+        if application_load_score is None:
+            event.fail("No load score was computed yet")
+            return
+        event.set_results(
+            {
+                "load-score": f"{application_load_score:.3f}",
+                "recommendation": self._load_recommendation(application_load_score),
+                "units": {
+                    unit.name.replace("/", "-"): f"{load_score:.3f}"
+                    for unit, load_score in self._unit_load_scores(relation).items()
+                },
+            }
+        )
+
+    def _update_metrics_job(self, event: ConfigChangedEvent) -> None:
+        """Publishes the scrape job built from the current charm config."""
+        self._metrics_endpoint.update_scrape_job_spec([self._metrics_job])
+
+    def _write_config_file(self, database_url: str, nrf_url: str) -> bool:
+        """Writes the SMF config file, unless it already has the expected content.
+
+        Args:
+            database_url (str): URL of the SMF database.
+            nrf_url (str): URL of the NRF.
+
+        Returns:
+            bool: Whether the config file was written.
+        """
         jinja2_environment = Environment(loader=FileSystemLoader("src/templates/"))
         template = jinja2_environment.get_template("smfcfg.yaml.j2")
         content = template.render(
             nrf_url=nrf_url,
             smf_url=self._smf_hostname,
-            pod_ip=self._pod_ip,
+            pfcp_address=self._pfcp_address,
             default_database_name=DEFAULT_DATABASE_NAME,
             smf_database_name=SMF_DATABASE_NAME,
             database_url=database_url,
+            enable_db_store=self.model.config["enable-db-store"],
         )
+        if self._config_file_content == content:
+            return False
         self._container.push(path=f"{BASE_CONFIG_PATH}/{CONFIG_FILE_NAME}", source=content)
         logger.info(f"Pushed {CONFIG_FILE_NAME} config file")
+        return True
 
     def _write_uerouting_config_file(self) -> None:
         with open("src/uerouting.yaml", "r") as f:
@@ -99,6 +343,130 @@ class SMFOperatorCharm(CharmBase):
         self._container.push(path=f"{BASE_CONFIG_PATH}/{UE_ROUTING_FILE_NAME}", source=content)
         logger.info(f"Pushed {UE_ROUTING_FILE_NAME} config file")
 
+    @property
+    def _pfcp_service_type(self) -> str:
+        """Returns the type of the Kubernetes service exposing PFCP.
+
+        Returns:
+            str: The PFCP service type.
+        """
+        return self.model.config["pfcp-service-type"]
+
+    @property
+    def _pfcp_service_annotations(self) -> Dict[str, str]:
+        """Returns the annotations of the Kubernetes service exposing PFCP.
+
+        Returns:
+            Dict[str, str]: The PFCP service annotations.
+        """
+        annotations = {}
+        for annotation in self.model.config["pfcp-service-annotations"].split(","):
+            if not annotation.strip():
+                continue
+            key, _, value = annotation.partition("=")
+            annotations[key.strip()] = value.strip()
+        return annotations
+
+    @property
+    def _metrics_job(self) -> dict:
+        """Returns the Prometheus scrape job of the SMF metrics endpoint.
+
+        Scrape tuning options are only applied when the charm config is valid.
+
+        Returns:
+            dict: The scrape job.
+        """
+        job = {"static_configs": [{"targets": [f"*:{PROMETHEUS_PORT}"]}]}  # type: dict
+        if self._invalid_config_message:
+            return job
+        if self.model.config["metrics-scrape-interval"]:
+            job["scrape_interval"] = self.model.config["metrics-scrape-interval"]
+        if self.model.config["metrics-scrape-timeout"]:
+            job["scrape_timeout"] = self.model.config["metrics-scrape-timeout"]
+        if self.model.config["metrics-sample-limit"]:
+            job["sample_limit"] = self.model.config["metrics-sample-limit"]
+        if self._metrics_drop_series:
+            job["metric_relabel_configs"] = [
+                {
+                    "source_labels": ["__name__"],
+                    "regex": "|".join(self._metrics_drop_series),
+                    "action": "drop",
+                }
+            ]
+        return job
+
+    @property
+    def _metrics_drop_series(self) -> List[str]:
+        """Returns the regular expressions of the names of the metrics dropped at ingestion.
+
+        Returns:
+            List[str]: The regular expressions.
+        """
+        return [
+            expression.strip()
+            for expression in self.model.config["metrics-drop-series"].split(",")
+            if expression.strip()
+        ]
+
+    @property
+    def _resource_requirements(self) -> Dict[str, ResourceRequirements]:
+        """Returns the resource requirements of the containers of the pod.
+
+        With guaranteed-qos, the requests of the workload container equal its limits and the
+        containers added by Juju get small equal requests and limits, so that the pod is given
+        the Guaranteed QoS class.
+
+        Returns:
+            Dict[str, ResourceRequirements]: The resource requirements keyed by container name,
+                empty when the charm config is invalid.
+        """
+        if self._invalid_config_message:
+            return {}
+        limits = {
+            resource: self.model.config[f"{resource}-limit"]
+            for resource in ("cpu", "memory")
+            if self.model.config[f"{resource}-limit"]
+        }
+        if self.model.config["guaranteed-qos"]:
+            charm_container_resources = ResourceRequirements(
+                limits=JUJU_CHARM_CONTAINER_RESOURCES, requests=JUJU_CHARM_CONTAINER_RESOURCES
+            )
+            return {
+                self._container_name: ResourceRequirements(limits=limits, requests=limits),
+                **{container: charm_container_resources for container in JUJU_CHARM_CONTAINERS},
+            }
+        requests = {
+            resource: self.model.config[f"{resource}-request"]
+            for resource in ("cpu", "memory")
+            if self.model.config[f"{resource}-request"]
+        }
+        return {
+            self._container_name: ResourceRequirements(limits=limits, requests=requests),
+            **{container: ResourceRequirements() for container in JUJU_CHARM_CONTAINERS},
+        }
+
+    @property
+    def _pfcp_address(self) -> IPv4Address:
+        """Returns the address PFCP is bound to.
+
+        Returns:
+            IPv4Address: The address of the N4 interface if attached, else the pod's address.
+        """
+        _, pfcp_interface_ip = self._pfcp_interface
+        if pfcp_interface_ip:
+            return IPv4Interface(pfcp_interface_ip).ip
+        return self._pod_ip
+
+    @property
+    def _pfcp_interface(self) -> Tuple[str, str]:
+        """Returns the host interface and address of the Multus network PFCP is bound to.
+
+        Returns:
+            Tuple[str, str]: The host interface and the address in CIDR notation, both empty
+                when PFCP is not bound to a Multus network.
+        """
+        return self.model.config["pfcp-interface-master"], self.model.config["pfcp-interface-ip"]
+
     @property
     def _nrf_data_is_available(self) -> bool:
         """Returns whether the NRF data is available.
@@ -158,14 +526,41 @@ class SMFOperatorCharm(CharmBase):
         logger.info("Config file is written")
         return True
 
+    @property
+    def _config_file_content(self) -> Optional[str]:
+        """Returns the content of the SMF config file.
+
+        The file is on the smf-volume storage, so it is kept across pod restarts.
+
+        Returns:
+            str: The content of the config file, None if it is not written.
+        """
+        if not self._config_file_is_written:
+            return None
+        return self._container.pull(f"{BASE_CONFIG_PATH}/{CONFIG_FILE_NAME}").read()
+
+    @property
+    def _smf_service_is_running(self) -> bool:
+        """Returns whether the SMF service is running.
+
+        Returns:
+            bool: Whether the SMF service is running.
+        """
+        service = self._container.get_services(self._service_name).get(self._service_name)
+        return bool(service and service.is_running())
+
     @property
     def _smf_hostname(self) -> str:
         return f"{self.model.app.name}.{self.model.name}.svc.cluster.local"
 
     def _on_smf_pebble_ready(
         self,
-        event: Union[PebbleReadyEvent, DatabaseCreatedEvent, NRFAvailableEvent],
+        event: Union[PebbleReadyEvent, ConfigChangedEvent, DatabaseReadyEvent, NRFAvailableEvent],
     ) -> None:
+        invalid_config_message = self._invalid_config_message
+        if invalid_config_message:
+            self.unit.status = BlockedStatus(invalid_config_message)
+            return
         if not self._default_database_relation_is_created:
             self.unit.status = BlockedStatus("Waiting for default database relation to be created")
             return
@@ -188,15 +583,123 @@ class SMFOperatorCharm(CharmBase):
         if not self._nrf_data_is_available:
             self.unit.status = WaitingStatus("Waiting for NRF data to be available")
             return
-        if not self._config_file_is_written:
-            self._write_config_file(
-                database_url=self._smf_database_data["uris"].split(",")[0],
-                nrf_url=self._nrf_requires.get_nrf_url(),
-            )
+        config_file_changed = self._write_config_file(
+            database_url=self._smf_database_data["uris"].split(",")[0],
+            nrf_url=self._nrf_requires.get_nrf_url(),
+        )
+        restart_required = config_file_changed and self._smf_service_is_running
         self._container.add_layer("smf", self._pebble_layer, combine=True)
         self._container.replan()
+        if restart_required:
+            self._container.restart(self._service_name)
+            logger.info("Restarted SMF service to apply the new config file")
         self.unit.status = ActiveStatus()
 
+    @property
+    def _invalid_config_message(self) -> Optional[str]:
+        """Returns a message describing the invalid charm config, if any.
+
+        Returns:
+            str: The message, None if the config is valid.
+        """
+        return (
+            self._invalid_pfcp_config_message
+            or self._invalid_metrics_config_message
+            or self._invalid_load_config_message
+            or self._invalid_resources_config_message
+        )
+
+    @property
+    def _invalid_pfcp_config_message(self) -> Optional[str]:
+        """Returns a message describing the invalid PFCP config, if any.
+
+        Returns:
+            str: The message, None if the config is valid.
+        """
+        if self._pfcp_service_type not in PFCP_SERVICE_TYPES:
+            return f"Invalid pfcp-service-type, must be one of {', '.join(PFCP_SERVICE_TYPES)}"
+        master = self.model.config["pfcp-interface-master"]
+        ip = self.model.config["pfcp-interface-ip"]
+        if bool(master) != bool(ip):
+            return "pfcp-interface-master and pfcp-interface-ip must be set together"
+        if ip:
+            try:
+                IPv4Interface(ip)
+            except ValueError:
+                return "Invalid pfcp-interface-ip, must be in CIDR notation"
+        return None
+
+    @property
+    def _invalid_metrics_config_message(self) -> Optional[str]:
+        """Returns a message describing the invalid metrics scrape config, if any.
+
+        Returns:
+            str: The message, None if the config is valid.
+        """
+        interval = self.model.config["metrics-scrape-interval"]
+        timeout = self.model.config["metrics-scrape-timeout"]
+        for key, value in (
+            ("metrics-scrape-interval", interval),
+            ("metrics-scrape-timeout", timeout),
+        ):
+            if value and not PROMETHEUS_DURATION_PATTERN.match(value):
+                return f"Invalid {key}, must be a duration such as 30s or 1m"
+        if interval and timeout and _duration_seconds(timeout) > _duration_seconds(interval):
+            return "Invalid metrics-scrape-timeout, must not exceed metrics-scrape-interval"
+        if self.model.config["metrics-sample-limit"] < 0:
+            return "Invalid metrics-sample-limit, must not be negative"
+        for expression in self._metrics_drop_series:
+            try:
+                re.compile(expression)
+            except re.error:
+                return f"Invalid metrics-drop-series, {expression} is not a regular expression"
+        return None
+
+    @property
+    def _invalid_load_config_message(self) -> Optional[str]:
+        """Returns a message describing the invalid load score config, if any.
+
+        Returns:
+            str: The message, None if the config is valid.
+        """
+        for key in ("load-session-capacity", "load-request-rate-capacity"):
+            if self.model.config[key] <= 0:
+                return f"Invalid {key}, must be positive"
+        if not (
+            0
+            <= self.model.config["load-scale-in-threshold"]
+            < self.model.config["load-scale-out-threshold"]
+        ):
+            return "Invalid load thresholds, scale-in must be lower than scale-out"
+        return None
+
+    @property
+    def _invalid_resources_config_message(self) -> Optional[str]:
+        """Returns a message describing the invalid compute resources config, if any.
+
+        Returns:
+            str: The message, None if the config is valid.
+        """
+        quantities = {}
+        for key in ("cpu-request", "cpu-limit", "memory-request", "memory-limit"):
+            if not self.model.config[key]:
+                continue
+            try:
+                quantities[key] = parse_quantity(self.model.config[key])
+            except ValueError:
+                return f"Invalid {key}, must be a Kubernetes quantity such as 500m or 1Gi"
+        for resource in ("cpu", "memory"):
+            request = quantities.get(f"{resource}-request")
+            limit = quantities.get(f"{resource}-limit")
+            if request is not None and limit is not None and request > limit:
+                return f"Invalid {resource}-request, must not exceed {resource}-limit"
+        if self.model.config["guaranteed-qos"]:
+            if "cpu-limit" not in quantities or "memory-limit" not in quantities:
+                return "guaranteed-qos requires cpu-limit and memory-limit"
+            if quantities["cpu-limit"] % 1:
+                return "Invalid cpu-limit, must be a whole number of CPUs with guaranteed-qos"
+        return None
+
     @property
     def _default_database_relation_is_created(self) -> bool:
         return self._relation_created("default-database")
@@ -263,5 +766,20 @@ class SMFOperatorCharm(CharmBase):
         return IPv4Address(check_output(["unit-get", "private-address"]).decode().strip())
 
 
+def _duration_seconds(duration: str) -> float:
+    """Returns the number of seconds of a Prometheus duration.
+
+    Args:
+        duration (str): A Prometheus duration, e.g. "1m30s".
+
+    Returns:
+        float: The number of seconds.
+    """
+    return sum(
+        int(amount) * PROMETHEUS_DURATION_UNITS[unit]
+        for amount, unit in re.findall(r"([0-9]+)(ms|[smhdwy])", duration)
+    )
+
+
 if __name__ == "__main__":
     main(SMFOperatorCharm)
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# Copyright 2022 Guillaume Belanger
+# See LICENSE file for licensing details.
+
+"""Sets the compute resources of the containers of the charm's pod.
+
+Juju creates the application's StatefulSet without resource requirements, so its pods run with the
+BestEffort QoS class. The resource requirements of the given containers (and init containers) of
+the StatefulSet pod template are patched in place. Patching the StatefulSet restarts the pod, so
+the patch is only applied when the requirements changed, comparing quantities canonically as the
+API server normalises them (e.g. "1000m" is stored as "1").
+
+The patch is independent of the other patches of the StatefulSet pod template (e.g. the Multus
+networks annotation): when both change in the same hook, the StatefulSet is rolled out twice.
+"""
+
+import logging
+from typing import Dict, List, Optional, Union
+
+from charms.observability_libs.v1.kubernetes_service_patch import _get_client
+from lightkube import ApiError
+from lightkube.core import exceptions
+from lightkube.models.core_v1 import ResourceRequirements
+from lightkube.resources.apps_v1 import StatefulSet
+from lightkube.types import PatchType
+from lightkube.utils.quantity import equals_canonically
+from ops.charm import CharmBase
+from ops.framework import BoundEvent, Object
+
+logger = logging.getLogger(__name__)
+
+
+class KubernetesComputeResourcesPatch(Object):
+    """Patches the resource requirements of the containers of the charm's StatefulSet."""
+
+    def __init__(
+        self,
+        charm: CharmBase,
+        resource_requirements: Dict[str, ResourceRequirements],
+        *,
+        refresh_event: Optional[Union[BoundEvent, List[BoundEvent]]] = None,
+    ):
+        """Constructor for KubernetesComputeResourcesPatch.
+
+        Args:
+            charm: the charm that is instantiating the library.
+            resource_requirements: resource requirements keyed by the name of the container or
+                init container they apply to. Empty requirements remove the requests and limits
+                of the container.
+            refresh_event: an optional bound event or list of bound events which
+                will be observed to re-apply the resource requirements (e.g. on config change).
+                The `install` and `upgrade-charm` events would be observed regardless.
+        """
+        super().__init__(charm, "kubernetes-compute-resources")
+        self.charm = charm
+        self.resource_requirements = resource_requirements
+        self.framework.observe(charm.on.install, self._patch)
+        self.framework.observe(charm.on.upgrade_charm, self._patch)
+        if refresh_event:
+            if not isinstance(refresh_event, list):
+                refresh_event = [refresh_event]
+            for event in refresh_event:
+                self.framework.observe(event, self._patch)
+
+    def _patch(self, _) -> None:
+        """Patches the resource requirements of the StatefulSet containers when they changed."""
+        try:
+            client = _get_client()
+        except exceptions.ConfigError as e:
+            logger.warning("Error creating k8s client: %s", e)
+            return
+
+        try:
+            statefulset = client.get(StatefulSet, name=self._app, namespace=self._namespace)
+            patch = self._pod_spec_patch(statefulset)
+            if not patch:
+                return
+            client.patch(
+                StatefulSet,
+                name=self._app,
+                namespace=self._namespace,
+                obj={"spec": {"template": {"spec": patch}}},
+                patch_type=PatchType.STRATEGIC,
+            )
+            logger.info("Compute resources of StatefulSet '%s' patched", self._app)
+        except ApiError as e:
+            if e.status.code == 403:
+                logger.error("Compute resources patch failed: `juju trust` this application.")
+            else:
+                logger.error("Compute resources patch failed: %s", str(e))
+
+    def _pod_spec_patch(self, statefulset: StatefulSet) -> dict:
+        """Returns the pod spec patch setting the resource requirements which changed.
+
+        Args:
+            statefulset: the application's StatefulSet.
+
+        Returns:
+            dict: the strategic merge patch of the pod spec, empty if nothing changed.
+        """
+        pod_spec = statefulset.spec.template.spec  # type: ignore[union-attr]
+        patch = {}  # type: Dict[str, List[dict]]
+        for field, containers in (
+            ("containers", pod_spec.containers),  # type: ignore[union-attr]
+            ("initContainers", pod_spec.initContainers or []),  # type: ignore[union-attr]
+        ):
+            for container in containers:
+                requirements = self.resource_requirements.get(container.name)
+                if requirements is None:
+                    continue
+                if equals_canonically(container.resources or ResourceRequirements(), requirements):
+                    continue
+                patch.setdefault(field, []).append(
+                    {
+                        "name": container.name,
+                        "resources": {
+                            # null removes the requests or limits which are not set anymore
+                            "limits": requirements.limits or None,
+                            "requests": requirements.requests or None,
+                        },
+                    }
+                )
+        return patch
+
+    @property
+    def _app(self) -> str:
+        """Name of the current Juju application."""
+        return self.charm.app.name
+
+    @property
+    def _namespace(self) -> str:
+        """The Kubernetes namespace we're running in, named after the Juju model."""
+        return self.charm.model.name
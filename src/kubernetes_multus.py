@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# Copyright 2022 Guillaume Belanger
+# See LICENSE file for licensing details.
+
+"""Attaches a secondary Multus network to the charm's pod.
+
+A NetworkAttachmentDefinition is applied in the model's namespace and the pod template of the
+application's StatefulSet is annotated so that Multus adds the interface to the pod. Patching the
+StatefulSet restarts the pod, so the annotation is only written when it changed.
+"""
+
+import json
+import logging
+from typing import List, Optional, Union
+
+from charms.observability_libs.v1.kubernetes_service_patch import _get_client
+from lightkube import ApiError, Client
+from lightkube.core import exceptions
+from lightkube.generic_resource import create_namespaced_resource
+from lightkube.models.meta_v1 import ObjectMeta
+from lightkube.resources.apps_v1 import StatefulSet
+from lightkube.types import PatchType
+from ops.charm import CharmBase
+from ops.framework import BoundEvent, Object
+
+logger = logging.getLogger(__name__)
+
+NETWORKS_ANNOTATION = "k8s.v1.cni.cncf.io/networks"
+
+NetworkAttachmentDefinition = create_namespaced_resource(
+    group="k8s.cni.cncf.io",
+    version="v1",
+    kind="NetworkAttachmentDefinition",
+    plural="network-attachment-definitions",
+)
+
+
+class KubernetesMultus(Object):
+    """Attaches a macvlan Multus network with a static address to the charm's pod."""
+
+    def __init__(
+        self,
+        charm: CharmBase,
+        network_attachment_definition_name: str,
+        interface_name: str,
+        master: str,
+        ip: str,
+        *,
+        refresh_event: Optional[Union[BoundEvent, List[BoundEvent]]] = None,
+    ):
+        """Constructor for KubernetesMultus.
+
+        Args:
+            charm: the charm that is instantiating the library.
+            network_attachment_definition_name: name of the NetworkAttachmentDefinition.
+            interface_name: name of the interface created in the pod.
+            master: host interface the macvlan interface is attached to. An empty value removes
+                the network from the pod.
+            ip: static address of the interface in CIDR notation.
+            refresh_event: an optional bound event or list of bound events which
+                will be observed to re-apply the attachment (e.g. on config change).
+                The `install` and `upgrade-charm` events would be observed regardless.
+        """
+        super().__init__(charm, "kubernetes-multus")
+        self.charm = charm
+        self.network_attachment_definition_name = network_attachment_definition_name
+        self.interface_name = interface_name
+        self.master = master
+        self.ip = ip
+        self.framework.observe(charm.on.install, self._configure)
+        self.framework.observe(charm.on.upgrade_charm, self._configure)
+        if refresh_event:
+            if not isinstance(refresh_event, list):
+                refresh_event = [refresh_event]
+            for event in refresh_event:
+                self.framework.observe(event, self._configure)
+
+    @property
+    def enabled(self) -> bool:
+        """Returns whether the secondary network is requested."""
+        return bool(self.master and self.ip)
+
+    def _network_attachment_definition(self) -> NetworkAttachmentDefinition:
+        """Returns the NetworkAttachmentDefinition of the secondary network."""
+        config = {
+            "cniVersion": "0.3.1",
+            "type": "macvlan",
+            "master": self.master,
+            "mode": "bridge",
+            "capabilities": {"ips": True},
+            "ipam": {"type": "static"},
+        }
+        return NetworkAttachmentDefinition(
+            metadata=ObjectMeta(
+                name=self.network_attachment_definition_name,
+                namespace=self._namespace,
+            ),
+            spec={"config": json.dumps(config)},
+        )
+
+    def _networks_annotation(self) -> Optional[str]:
+        """Returns the value of the pod networks annotation, None when disabled."""
+        if not self.enabled:
+            return None
+        return json.dumps(
+            [
+                {
+                    "name": self.network_attachment_definition_name,
+                    "interface": self.interface_name,
+                    "ips": [self.ip],
+                }
+            ]
+        )
+
+    def _configure(self, _) -> None:
+        """Applies the NetworkAttachmentDefinition and annotates the StatefulSet pod template."""
+        try:
+            client = _get_client()
+        except exceptions.ConfigError as e:
+            logger.warning("Error creating k8s client: %s", e)
+            return
+
+        try:
+            if self.enabled:
+                client.apply(
+                    self._network_attachment_definition(),
+                    field_manager=self._app,
+                    force=True,
+                )
+            self._patch_statefulset(client)
+        except ApiError as e:
+            if e.status.code == 403:
+                logger.error("Multus network attachment failed: `juju trust` this application.")
+            else:
+                logger.error("Multus network attachment failed: %s", str(e))
+
+    def _patch_statefulset(self, client: Client) -> None:
+        """Sets the networks annotation on the StatefulSet pod template when it changed."""
+        statefulset = client.get(StatefulSet, name=self._app, namespace=self._namespace)
+        annotations = statefulset.spec.template.metadata.annotations or {}  # type: ignore[union-attr]  # noqa: E501
+        annotation = self._networks_annotation()
+        if annotations.get(NETWORKS_ANNOTATION) == annotation:
+            return
+        client.patch(
+            StatefulSet,
+            name=self._app,
+            namespace=self._namespace,
+            obj={
+                "spec": {
+                    "template": {"metadata": {"annotations": {NETWORKS_ANNOTATION: annotation}}}
+                }
+            },
+            patch_type=PatchType.MERGE,
+        )
+        logger.info("Multus networks of StatefulSet '%s' set to %s", self._app, annotation)
+
+    @property
+    def _app(self) -> str:
+        """Name of the current Juju application."""
+        return self.charm.app.name
+
+    @property
+    def _namespace(self) -> str:
+        """The Kubernetes namespace we're running in, named after the Juju model."""
+        return self.charm.model.name
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# Copyright 2022 Guillaume Belanger
+# See LICENSE file for licensing details.
+
+"""Reads a summary of the SMF workload metrics from its Prometheus exporter.
+
+The exporter payload is parsed line by line as it is received, and only the few metric families
+used by the charm are looked at, so that large payloads (e.g. with per-UE series) are never
+loaded in memory as a whole.
+"""
+
+import logging
+import re
+from http.client import HTTPException
+from typing import Dict, Iterable, Optional, Set, Tuple
+from urllib.request import urlopen
+
+logger = logging.getLogger(__name__)
+
+PDU_SESSIONS_METRIC = "smf_pdu_sessions"
+N11_MESSAGES_METRIC = "smf_n11_msg_stats"
+FAILURE_RESULT = "Failure"
+# Direction of the N11 messages received by the SMF, i.e. requests, responses being "Out"
+INBOUND_DIRECTION = "In"
+
+_LABEL_PATTERN = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:\\.|[^"\\])*)"')
+
+
+class SMFMetrics:
+    """Summary of the SMF workload metrics at the time of a scrape."""
+
+    def __init__(self):
+        self.pdu_sessions = 0.0
+        self.upfs: Set[str] = set()
+        # N11 requests received by the SMF and the failed ones, responses are not counted
+        self.n11_messages = 0.0
+        self.n11_failures = 0.0
+
+    def add_sample(self, name: str, labels: Dict[str, str], value: float) -> None:
+        """Accounts for a sample of one of the metric families of the summary.
+
+        Args:
+            name: metric name.
+            labels: labels of the sample.
+            value: value of the sample.
+        """
+        if name == PDU_SESSIONS_METRIC:
+            self.pdu_sessions += value
+            if labels.get("upf"):
+                self.upfs.add(labels["upf"])
+        elif name in (N11_MESSAGES_METRIC, f"{N11_MESSAGES_METRIC}_total"):
+            if labels.get("direction") != INBOUND_DIRECTION:
+                return
+            self.n11_messages += value
+            if labels.get("result") == FAILURE_RESULT:
+                self.n11_failures += value
+
+
+def parse_sample(line: str) -> Optional[Tuple[str, Dict[str, str], float]]:
+    """Parses a sample line of the Prometheus text exposition format.
+
+    Args:
+        line: a line of the exposition.
+
+    Returns:
+        The metric name, labels and value of the sample, None for comments, blank and
+        malformed lines.
+    """
+    line = line.strip()
+    if not line or line.startswith("#"):
+        return None
+    labels = {}
+    if "{" in line:
+        name, _, rest = line.partition("{")
+        label_block, _, rest = rest.rpartition("}")
+        labels = {key: value for key, value in _LABEL_PATTERN.findall(label_block)}
+    else:
+        name, _, rest = line.partition(" ")
+    try:
+        value = float(rest.split()[0])
+    except (IndexError, ValueError):
+        return None
+    return name.strip(), labels, value
+
+
+def parse_metrics(lines: Iterable[str], families: Tuple[str, ...]) -> SMFMetrics:
+    """Builds a metrics summary from the lines of a Prometheus text exposition.
+
+    Args:
+        lines: lines of the exposition, which may be consumed lazily.
+        families: prefixes of the names of the metrics to parse, other lines are skipped
+            without being parsed.
+
+    Returns:
+        SMFMetrics: The metrics summary.
+    """
+    metrics = SMFMetrics()
+    for line in lines:
+        if not line.startswith(families):
+            continue
+        sample = parse_sample(line)
+        if sample:
+            metrics.add_sample(*sample)
+    return metrics
+
+
+def fetch_metrics(url: str, timeout: float) -> Optional[SMFMetrics]:
+    """Scrapes the SMF metrics endpoint and summarises the metrics the charm needs.
+
+    Args:
+        url: URL of the metrics endpoint.
+        timeout: timeout of the scrape, in seconds.
+
+    Returns:
+        SMFMetrics: The metrics summary, None if the endpoint could not be scraped.
+    """
+    families = (PDU_SESSIONS_METRIC, N11_MESSAGES_METRIC)
+    try:
+        with urlopen(url, timeout=timeout) as response:
+            return parse_metrics((line.decode(errors="replace") for line in response), families)
+    except (OSError, HTTPException) as e:
+        logger.warning("Could not scrape SMF metrics from %s: %s", url, e)
+        return None
@@ -0,0 +1,227 @@
+# Copyright 2022 Guillaume Belanger
+# See LICENSE file for licensing details.
+
+import copy
+import hashlib
+import json
+import random
+import re
+import time
+import timeit
+import unittest
+
+from charms.observability_libs.v0.juju_topology import JujuTopology
+from charms.prometheus_k8s.v0.prometheus_scrape import PrometheusConfig, _dedupe_job_names
+
+HASH_SUFFIX = re.compile(r"_[0-9a-f]{64}$")
+
+
+def _reference_dedupe_job_names(jobs):
+    """The quadratic implementation of _dedupe_job_names the library had before."""
+    jobs_copy = copy.deepcopy(jobs)
+    jobs_dict = {
+        job["job_name"]: list(filter(lambda x: x["job_name"] == job["job_name"], jobs_copy))
+        for job in jobs_copy
+    }
+    for key in jobs_dict:
+        if len(jobs_dict[key]) > 1:
+            for job in jobs_dict[key]:
+                hashed = hashlib.sha256(json.dumps(job).encode()).hexdigest()
+                job["job_name"] = "{}_{}".format(job["job_name"], hashed)
+    new_jobs = []
+    for key in jobs_dict:
+        new_jobs.extend(jobs_dict[key])
+    deduped_jobs = []
+    seen = []
+    for job in new_jobs:
+        hashed = hashlib.sha256(json.dumps(job).encode()).hexdigest()
+        if hashed in seen:
+            continue
+        seen.append(hashed)
+        deduped_jobs.append(job)
+    return deduped_jobs
+
+
+def _reference_expand_wildcard_targets_into_individual_jobs(  # noqa: C901
+    scrape_jobs, hosts, topology=None
+):
+    """The implementation of wildcard target expansion the library had before."""
+    modified_scrape_jobs = []
+    for job in scrape_jobs:
+        static_configs = job.get("static_configs")
+        if not static_configs:
+            continue
+        non_wildcard_static_configs = []
+        for static_config in static_configs:
+            targets = static_config.get("targets")
+            if not targets:
+                continue
+            non_wildcard_targets = []
+            wildcard_targets = []
+            for target in targets:
+                if re.compile(r"\*(?:(:\d+))?").match(target):
+                    wildcard_targets.append(target)
+                else:
+                    non_wildcard_targets.append(target)
+            if non_wildcard_targets:
+                non_wildcard_static_config = static_config.copy()
+                non_wildcard_static_config["targets"] = non_wildcard_targets
+                if topology:
+                    non_wildcard_static_config["labels"] = {
+                        **non_wildcard_static_config.get("labels", {}),
+                        **topology.label_matcher_dict,
+                    }
+                non_wildcard_static_configs.append(non_wildcard_static_config)
+            if wildcard_targets:
+                for unit_name, (unit_hostname, unit_path) in hosts.items():
+                    modified_job = job.copy()
+                    modified_job["static_configs"] = [static_config.copy()]
+                    modified_static_config = modified_job["static_configs"][0]
+                    modified_static_config["targets"] = [
+                        target.replace("*", unit_hostname) for target in wildcard_targets
+                    ]
+                    unit_num = unit_name.split("/")[-1]
+                    job_name = modified_job.get("job_name", "unnamed-job") + "-" + unit_num
+                    modified_job["job_name"] = job_name
+                    modified_job["metrics_path"] = unit_path + (
+                        job.get("metrics_path") or "/metrics"
+                    )
+                    if topology:
+                        modified_static_config["labels"] = {
+                            **modified_static_config.get("labels", {}),
+                            **topology.label_matcher_dict,
+                            **{"juju_unit": unit_name},
+                        }
+                        modified_job["relabel_configs"] = modified_job.get(
+                            "relabel_configs", []
+                        ) + [PrometheusConfig.topology_relabel_config_wildcard]
+                    modified_scrape_jobs.append(modified_job)
+        if non_wildcard_static_configs:
+            modified_job = job.copy()
+            modified_job["static_configs"] = non_wildcard_static_configs
+            modified_job["metrics_path"] = modified_job.get("metrics_path") or "/metrics"
+            if topology:
+                modified_job["relabel_configs"] = modified_job.get("relabel_configs", []) + [
+                    PrometheusConfig.topology_relabel_config
+                ]
+            modified_scrape_jobs.append(modified_job)
+    return modified_scrape_jobs
+
+
+def _timed(function):
+    """Returns the result of `function` and its run time, in seconds."""
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
+
+
+def _best_seconds(functions, repeat):
+    """Returns the shortest run time of each function, in seconds.
+
+    The functions are run in turn `repeat` times, so that they are equally affected by the
+    load of the machine.
+    """
+    best = [float("inf")] * len(functions)
+    for _ in range(repeat):
+        for index, function in enumerate(functions):
+            best[index] = min(best[index], timeit.timeit(function, number=1))
+    return best
+
+
+def _without_hash_suffix(jobs):
+    """Returns the jobs with the hash appended to duplicated job names removed.
+
+    The hash is computed over a different JSON encoding by each implementation.
+    """
+    return [dict(job, job_name=HASH_SUFFIX.sub("", job["job_name"])) for job in jobs]
+
+
+class TestDedupeJobNamesBenchmark(unittest.TestCase):
+    def setUp(self):
+        random.seed(0)
+        self.jobs = [
+            {
+                "job_name": f"job-{random.randint(0, 6000)}",
+                "metrics_path": "/metrics",
+                "static_configs": [{"targets": [f"host-{random.randint(0, 3)}:9089"]}],
+            }
+            for _ in range(10000)
+        ]
+
+    def test_given_10k_jobs_when_dedupe_job_names_then_jobs_are_deduplicated_like_before_and_faster(  # noqa: E501
+        self,
+    ):
+        reference, reference_seconds = _timed(lambda: _reference_dedupe_job_names(self.jobs))
+        deduped, seconds = _timed(lambda: _dedupe_job_names(self.jobs))
+
+        self.assertEqual(_without_hash_suffix(deduped), _without_hash_suffix(reference))
+        self.assertGreater(
+            reference_seconds, 10 * seconds, f"{seconds:.3f}s, {reference_seconds:.3f}s before"
+        )
+
+
+class TestExpandWildcardTargetsBenchmark(unittest.TestCase):
+    def setUp(self):
+        self.hosts = {
+            f"smf/{unit}": (f"10.1.{unit // 256}.{unit % 256}", "/smf" if unit % 2 else "")
+            for unit in range(500)
+        }
+        self.jobs = [
+            {
+                "job_name": f"job-{index}",
+                "metrics_path": "/metrics",
+                "static_configs": [
+                    {"targets": ["*:9089", "*", "fixed:9090"], "labels": {"team": "core"}},
+                    {"targets": ["other:9091"]},
+                ],
+                "relabel_configs": [{"target_label": "index", "replacement": str(index)}],
+            }
+            for index in range(20)
+        ]
+        self.topology = JujuTopology(
+            model="model",
+            model_uuid="00000000-0000-4000-8000-000000000000",
+            application="smf",
+            charm_name="smf-operator",
+        )
+
+    def test_given_500_units_and_20_jobs_when_expand_wildcard_targets_then_jobs_are_expanded_like_before_and_faster(  # noqa: E501
+        self,
+    ):
+        topologies = (self.topology, None)
+        for topology in topologies:
+            with self.subTest(topology=topology):
+                self.assertEqual(
+                    json.dumps(
+                        PrometheusConfig.expand_wildcard_targets_into_individual_jobs(
+                            self.jobs, self.hosts, topology
+                        )
+                    ),
+                    json.dumps(
+                        _reference_expand_wildcard_targets_into_individual_jobs(
+                            self.jobs, self.hosts, topology
+                        )
+                    ),
+                )
+
+        reference_seconds, seconds = _best_seconds(
+            [
+                lambda: [
+                    _reference_expand_wildcard_targets_into_individual_jobs(
+                        self.jobs, self.hosts, topology
+                    )
+                    for topology in topologies
+                ],
+                lambda: [
+                    PrometheusConfig.expand_wildcard_targets_into_individual_jobs(
+                        self.jobs, self.hosts, topology
+                    )
+                    for topology in topologies
+                ],
+            ],
+            repeat=7,
+        )
+
+        self.assertGreater(
+            reference_seconds, seconds, f"{seconds:.3f}s, {reference_seconds:.3f}s before"
+        )
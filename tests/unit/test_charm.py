@@ -1,11 +1,18 @@
 # Copyright 2022 Guillaume Belanger
 # See LICENSE file for licensing details.
 
+import io
+import json
 import unittest
-from unittest.mock import Mock, patch
+from unittest.mock import ANY, Mock, patch
 
+from lightkube.models.apps_v1 import StatefulSetSpec
+from lightkube.models.core_v1 import Container, PodSpec, PodTemplateSpec, ServicePort
+from lightkube.models.meta_v1 import LabelSelector, ObjectMeta
+from lightkube.resources.apps_v1 import StatefulSet
+from lightkube.types import PatchType
 from ops import testing
-from ops.model import ActiveStatus
+from ops.model import ActiveStatus, BlockedStatus
 
 from charm import SMFOperatorCharm
 
@@ -13,9 +20,15 @@ from charm import SMFOperatorCharm
 class TestCharm(unittest.TestCase):
     @patch(
         "charm.KubernetesServicePatch",
-        lambda charm, ports: None,
+        lambda charm, ports, **kwargs: None,
     )
     def setUp(self):
+        multus_patcher = patch("kubernetes_multus._get_client")
+        self.patch_multus_client = multus_patcher.start()
+        self.addCleanup(multus_patcher.stop)
+        compute_resources_patcher = patch("kubernetes_compute_resources._get_client")
+        self.patch_compute_resources_client = compute_resources_patcher.start()
+        self.addCleanup(compute_resources_patcher.stop)
         self.namespace = "whatever"
         self.harness = testing.Harness(SMFOperatorCharm)
         self.harness.set_model_name(name=self.namespace)
@@ -105,14 +118,18 @@ class TestCharm(unittest.TestCase):
         )
 
     @patch("charm.check_output")
+    @patch("ops.model.Container.push", Mock())
+    @patch("ops.model.Container.pull")
     @patch("ops.model.Container.exists")
     def test_given_config_file_is_written_when_pebble_ready_then_pebble_plan_is_applied(
         self,
         patch_exists,
+        patch_pull,
         patch_check_output,
     ):
         pod_ip = "1.1.1.1"
         patch_exists.return_value = True
+        patch_pull.return_value = io.StringIO("")
         patch_check_output.return_value = pod_ip.encode()
 
         self._default_database_is_available()
@@ -145,11 +162,14 @@ class TestCharm(unittest.TestCase):
         self.assertEqual(expected_plan, updated_plan)
 
     @patch("charm.check_output")
+    @patch("ops.model.Container.push", Mock())
+    @patch("ops.model.Container.pull")
     @patch("ops.model.Container.exists")
     def test_given_config_file_is_written_when_pebble_ready_then_status_is_active(
-        self, patch_exists, patch_check_output
+        self, patch_exists, patch_pull, patch_check_output
     ):
         patch_exists.return_value = True
+        patch_pull.return_value = io.StringIO("")
         patch_check_output.return_value = b"1.2.3.4"
 
         self._default_database_is_available()
@@ -159,3 +179,502 @@ class TestCharm(unittest.TestCase):
         self.harness.container_pebble_ready("smf")
 
         self.assertEqual(self.harness.model.unit.status, ActiveStatus())
+
+    def test_given_invalid_pfcp_service_type_when_config_changed_then_status_is_blocked(self):
+        self.harness.update_config(key_values={"pfcp-service-type": "ClusterIP"})
+
+        self.assertEqual(
+            self.harness.model.unit.status,
+            BlockedStatus("Invalid pfcp-service-type, must be one of LoadBalancer, NodePort"),
+        )
+
+    @patch("charm.KubernetesServicePatch")
+    def test_given_pfcp_service_config_when_charm_is_initialised_then_pfcp_service_is_patched(
+        self, patch_service_patch
+    ):
+        harness = testing.Harness(SMFOperatorCharm)
+        self.addCleanup(harness.cleanup)
+        harness.update_config(
+            key_values={
+                "pfcp-service-type": "NodePort",
+                "pfcp-service-annotations": "a.b/pool=n4, c.d/shared=smf",
+            }
+        )
+
+        harness.begin()
+
+        patch_service_patch.assert_any_call(
+            charm=harness.charm,
+            ports=[ServicePort(name="pfcp", port=8805, protocol="UDP")],
+            service_name="smf-operator-pfcp",
+            service_type="NodePort",
+            additional_annotations={"a.b/pool": "n4", "c.d/shared": "smf"},
+            refresh_event=ANY,
+            server_side_apply=True,
+            external_traffic_policy="Local",
+            session_affinity="ClientIP",
+        )
+
+    @patch("charm.KubernetesServicePatch")
+    def test_given_invalid_pfcp_service_type_when_charm_is_initialised_then_pfcp_service_is_not_patched(  # noqa: E501
+        self, patch_service_patch
+    ):
+        harness = testing.Harness(SMFOperatorCharm)
+        self.addCleanup(harness.cleanup)
+        harness.update_config(key_values={"pfcp-service-type": "ClusterIP"})
+
+        harness.begin()
+
+        service_names = [
+            call.kwargs.get("service_name") for call in patch_service_patch.call_args_list
+        ]
+        self.assertNotIn("smf-operator-pfcp", service_names)
+
+    @patch("charm.check_output")
+    @patch("ops.model.Container.push")
+    def test_given_pfcp_interface_configured_when_database_is_created_then_pfcp_is_bound_to_interface_address(  # noqa: E501
+        self,
+        patch_push,
+        patch_check_output,
+    ):
+        patch_check_output.return_value = b"1.2.3.4"
+        self.harness.update_config(
+            key_values={"pfcp-interface-master": "eth1", "pfcp-interface-ip": "192.168.250.3/24"}
+        )
+        self.harness.set_can_connect(container="smf", val=True)
+
+        self._nrf_is_available()
+        self._default_database_is_available()
+        self._smf_database_is_available()
+
+        self.assertIn("  pfcp:\n    addr: 192.168.250.3\n", patch_push.call_args.kwargs["source"])
+
+    def test_given_invalid_pfcp_interface_ip_when_config_changed_then_status_is_blocked(self):
+        self.harness.update_config(
+            key_values={"pfcp-interface-master": "eth1", "pfcp-interface-ip": "192.168.250.3/99"}
+        )
+
+        self.assertEqual(
+            self.harness.model.unit.status,
+            BlockedStatus("Invalid pfcp-interface-ip, must be in CIDR notation"),
+        )
+
+    def test_given_pfcp_interface_master_without_ip_when_config_changed_then_status_is_blocked(
+        self,
+    ):
+        self.harness.update_config(key_values={"pfcp-interface-master": "eth1"})
+
+        self.assertEqual(
+            self.harness.model.unit.status,
+            BlockedStatus("pfcp-interface-master and pfcp-interface-ip must be set together"),
+        )
+
+    @patch("charm.KubernetesServicePatch", Mock())
+    def test_given_pfcp_interface_configured_when_config_changed_then_network_is_attached_to_pod(
+        self,
+    ):
+        client = self.patch_multus_client.return_value
+        client.get.return_value = StatefulSet(
+            spec=StatefulSetSpec(
+                selector=LabelSelector(),
+                serviceName="smf-operator-endpoints",
+                template=PodTemplateSpec(metadata=ObjectMeta(annotations={})),
+            )
+        )
+
+        harness = testing.Harness(SMFOperatorCharm)
+        self.addCleanup(harness.cleanup)
+        harness.set_model_name(name=self.namespace)
+        harness.update_config(
+            key_values={"pfcp-interface-master": "eth1", "pfcp-interface-ip": "192.168.250.3/24"}
+        )
+        harness.begin()
+
+        harness.charm.on.config_changed.emit()
+
+        network_attachment_definition = client.apply.call_args.args[0]
+        self.assertEqual(network_attachment_definition.metadata.name, "smf-operator-n4")
+        self.assertEqual(network_attachment_definition.metadata.namespace, self.namespace)
+        self.assertEqual(
+            json.loads(network_attachment_definition.spec["config"])["master"], "eth1"
+        )
+        client.patch.assert_called_once_with(
+            StatefulSet,
+            name="smf-operator",
+            namespace=self.namespace,
+            obj={
+                "spec": {
+                    "template": {
+                        "metadata": {
+                            "annotations": {
+                                "k8s.v1.cni.cncf.io/networks": json.dumps(
+                                    [
+                                        {
+                                            "name": "smf-operator-n4",
+                                            "interface": "n4",
+                                            "ips": ["192.168.250.3/24"],
+                                        }
+                                    ]
+                                )
+                            }
+                        }
+                    }
+                }
+            },
+            patch_type=PatchType.MERGE,
+        )
+
+    @patch("charm.KubernetesServicePatch", Mock())
+    def test_given_invalid_pfcp_interface_ip_when_config_changed_then_network_is_not_attached_to_pod(  # noqa: E501
+        self,
+    ):
+        client = self.patch_multus_client.return_value
+        client.get.return_value = StatefulSet(
+            spec=StatefulSetSpec(
+                selector=LabelSelector(),
+                serviceName="smf-operator-endpoints",
+                template=PodTemplateSpec(metadata=ObjectMeta(annotations={})),
+            )
+        )
+
+        harness = testing.Harness(SMFOperatorCharm)
+        self.addCleanup(harness.cleanup)
+        harness.set_model_name(name=self.namespace)
+        harness.update_config(
+            key_values={"pfcp-interface-master": "eth1", "pfcp-interface-ip": "192.168.250.3/99"}
+        )
+        harness.begin()
+
+        harness.charm.on.config_changed.emit()
+
+        client.apply.assert_not_called()
+        client.patch.assert_not_called()
+
+    @patch("charm.KubernetesServicePatch", Mock())
+    def test_given_network_attached_and_unrelated_invalid_config_when_config_changed_then_network_is_left_attached(  # noqa: E501
+        self,
+    ):
+        client = self.patch_multus_client.return_value
+        client.get.return_value = StatefulSet(
+            spec=StatefulSetSpec(
+                selector=LabelSelector(),
+                serviceName="smf-operator-endpoints",
+                template=PodTemplateSpec(
+                    metadata=ObjectMeta(
+                        annotations={
+                            "k8s.v1.cni.cncf.io/networks": json.dumps(
+                                [
+                                    {
+                                        "name": "smf-operator-n4",
+                                        "interface": "n4",
+                                        "ips": ["192.168.250.3/24"],
+                                    }
+                                ]
+                            )
+                        }
+                    )
+                ),
+            )
+        )
+
+        harness = testing.Harness(SMFOperatorCharm)
+        self.addCleanup(harness.cleanup)
+        harness.set_model_name(name=self.namespace)
+        harness.update_config(
+            key_values={
+                "pfcp-interface-master": "eth1",
+                "pfcp-interface-ip": "192.168.250.3/24",
+                "metrics-scrape-interval": "bogus",
+            }
+        )
+        harness.begin()
+
+        harness.charm.on.config_changed.emit()
+
+        client.apply.assert_not_called()
+        client.patch.assert_not_called()
+
+    @patch("charm.KubernetesServicePatch")
+    def test_given_pfcp_interface_configured_when_charm_is_initialised_then_pfcp_service_is_not_patched(  # noqa: E501
+        self, patch_service_patch
+    ):
+        harness = testing.Harness(SMFOperatorCharm)
+        self.addCleanup(harness.cleanup)
+        harness.update_config(
+            key_values={"pfcp-interface-master": "eth1", "pfcp-interface-ip": "192.168.250.3/24"}
+        )
+
+        harness.begin()
+
+        service_names = [
+            call.kwargs.get("service_name") for call in patch_service_patch.call_args_list
+        ]
+        self.assertNotIn("smf-operator-pfcp", service_names)
+
+    @patch("ops.testing._TestingModelBackend.network_get")
+    def test_given_metrics_endpoint_relation_when_joined_then_smf_recording_rules_are_forwarded(
+        self, patch_network_get
+    ):
+        patch_network_get.return_value = {
+            "bind-addresses": [
+                {
+                    "interface-name": "eth0",
+                    "addresses": [{"cidr": "1.2.3.0/24", "value": "1.2.3.4"}],
+                }
+            ]
+        }
+        self.harness.set_leader(True)
+
+        relation_id = self.harness.add_relation("metrics-endpoint", "prometheus")
+        self.harness.add_relation_unit(relation_id, "prometheus/0")
+
+        alert_rules = json.loads(
+            self.harness.get_relation_data(relation_id, "smf-operator")["alert_rules"]
+        )
+        recorded_series = [
+            rule.get("record") for group in alert_rules["groups"] for rule in group["rules"]
+        ]
+        self.assertIn("smf:pdu_session_establishment_requests:rate5m", recorded_series)
+        self.assertIn("smf:pfcp_messages:rate5m", recorded_series)
+
+    @patch("ops.testing._TestingModelBackend.network_get")
+    def test_given_metrics_scrape_config_when_metrics_endpoint_relation_joined_then_scrape_job_is_tuned(  # noqa: E501
+        self, patch_network_get
+    ):
+        patch_network_get.return_value = {
+            "bind-addresses": [
+                {
+                    "interface-name": "eth0",
+                    "addresses": [{"cidr": "1.2.3.0/24", "value": "1.2.3.4"}],
+                }
+            ]
+        }
+        self.harness.set_leader(True)
+        self.harness.update_config(
+            key_values={
+                "metrics-scrape-interval": "30s",
+                "metrics-scrape-timeout": "10s",
+                "metrics-sample-limit": 5000,
+                "metrics-drop-series": "smf_pdu_session_profile, go_.*",
+            }
+        )
+
+        relation_id = self.harness.add_relation("metrics-endpoint", "prometheus")
+        self.harness.add_relation_unit(relation_id, "prometheus/0")
+
+        scrape_jobs = json.loads(
+            self.harness.get_relation_data(relation_id, "smf-operator")["scrape_jobs"]
+        )
+        self.assertEqual(
+            scrape_jobs,
+            [
+                {
+                    "metrics_path": "/metrics",
+                    "static_configs": [{"targets": ["*:9089"]}],
+                    "scrape_interval": "30s",
+                    "scrape_timeout": "10s",
+                    "sample_limit": 5000,
+                    "metric_relabel_configs": [
+                        {
+                            "source_labels": ["__name__"],
+                            "regex": "smf_pdu_session_profile|go_.*",
+                            "action": "drop",
+                        }
+                    ],
+                }
+            ],
+        )
+
+    def test_given_scrape_timeout_exceeds_interval_when_config_changed_then_status_is_blocked(
+        self,
+    ):
+        self.harness.update_config(
+            key_values={"metrics-scrape-interval": "15s", "metrics-scrape-timeout": "1m"}
+        )
+
+        self.assertEqual(
+            self.harness.model.unit.status,
+            BlockedStatus(
+                "Invalid metrics-scrape-timeout, must not exceed metrics-scrape-interval"
+            ),
+        )
+
+    @patch("smf_metrics.urlopen")
+    def test_given_unit_is_active_when_update_status_then_metrics_summary_is_in_status(
+        self, patch_urlopen
+    ):
+        patch_urlopen.return_value = io.BytesIO(
+            b"# HELP smf_pdu_sessions Number of PDU sessions\n"
+            b"# TYPE smf_pdu_sessions gauge\n"
+            b'smf_pdu_sessions{id="1",slice="1",upf="upf-1"} 12\n'
+            b'smf_pdu_sessions{id="2",slice="1",upf="upf-2"} 30\n'
+            b'smf_pdu_session_profile{id="imsi-1",ip="172.250.0.1",state="Active"} 1\n'
+            b'smf_n11_msg_stats{direction="In",msg_type="CreateSmContext",result="Success"} 95\n'
+            b'smf_n11_msg_stats{direction="In",msg_type="CreateSmContext",result="Failure"} 5\n'
+            b'smf_n11_msg_stats{direction="Out",msg_type="CreateSmContext",result="Success"} 100\n'
+        )
+        self.harness.charm.unit.status = ActiveStatus()
+
+        self.harness.charm.on.update_status.emit()
+
+        self.assertEqual(
+            self.harness.model.unit.status,
+            ActiveStatus("42 PDU sessions, 2 UPFs, 5.0% N11 errors"),
+        )
+
+    @patch("smf_metrics.urlopen")
+    def test_given_peer_relation_when_update_status_then_load_score_is_published(
+        self, patch_urlopen
+    ):
+        patch_urlopen.return_value = io.BytesIO(
+            b'smf_pdu_sessions{id="1",slice="1",upf="upf-1"} 90\n'
+        )
+        self.harness.set_leader(True)
+        self.harness.update_config(key_values={"load-session-capacity": 100})
+        relation_id = self.harness.add_relation("replicas", "smf-operator")
+        self.harness.charm.unit.status = ActiveStatus()
+
+        self.harness.charm.on.update_status.emit()
+
+        self.assertEqual(
+            self.harness.get_relation_data(relation_id, "smf-operator/0"),
+            {"load-score": "0.900", "load-recommendation": "scale-out"},
+        )
+        self.assertEqual(
+            self.harness.get_relation_data(relation_id, "smf-operator"),
+            {"load-score": "0.900", "load-recommendation": "scale-out"},
+        )
+
+    @patch("charm.time")
+    @patch("smf_metrics.urlopen")
+    def test_given_n11_requests_and_responses_when_update_status_then_load_score_counts_requests_only(  # noqa: E501
+        self, patch_urlopen, patch_time
+    ):
+        patch_urlopen.side_effect = [
+            io.BytesIO(
+                (
+                    f'smf_n11_msg_stats{{direction="In",msg_type="CreateSmContext"}} {requests}\n'
+                    f'smf_n11_msg_stats{{direction="Out",msg_type="CreateSmContext"}} {requests}\n'
+                ).encode()
+            )
+            for requests in (100, 200)
+        ]
+        patch_time.time.side_effect = [1000.0, 1010.0]
+        self.harness.update_config(key_values={"load-request-rate-capacity": 20.0})
+        relation_id = self.harness.add_relation("replicas", "smf-operator")
+        self.harness.charm.unit.status = ActiveStatus()
+
+        self.harness.charm.on.update_status.emit()
+        self.harness.charm.on.update_status.emit()
+
+        self.assertEqual(
+            self.harness.get_relation_data(relation_id, "smf-operator/0")["load-score"], "0.500"
+        )
+
+    def test_given_units_published_load_scores_when_get_load_score_action_then_scores_are_returned(  # noqa: E501
+        self,
+    ):
+        relation_id = self.harness.add_relation("replicas", "smf-operator")
+        self.harness.add_relation_unit(relation_id, "smf-operator/1")
+        self.harness.update_relation_data(
+            relation_id, "smf-operator/0", {"load-score": "0.100", "load-recommendation": "hold"}
+        )
+        self.harness.update_relation_data(
+            relation_id, "smf-operator/1", {"load-score": "0.300", "load-recommendation": "hold"}
+        )
+        event = Mock()
+
+        self.harness.charm._on_get_load_score_action(event=event)
+
+        event.set_results.assert_called_with(
+            {
+                "load-score": "0.200",
+                "recommendation": "scale-in",
+                "units": {"smf-operator-0": "0.100", "smf-operator-1": "0.300"},
+            }
+        )
+
+    @patch("charm.KubernetesServicePatch", Mock())
+    def test_given_guaranteed_qos_when_config_changed_then_statefulset_containers_request_their_limits(  # noqa: E501
+        self,
+    ):
+        client = self.patch_compute_resources_client.return_value
+        client.get.return_value = StatefulSet(
+            spec=StatefulSetSpec(
+                selector=LabelSelector(),
+                serviceName="smf-operator-endpoints",
+                template=PodTemplateSpec(
+                    spec=PodSpec(
+                        containers=[Container(name="charm"), Container(name="smf")],
+                        initContainers=[Container(name="charm-init")],
+                    )
+                ),
+            )
+        )
+
+        harness = testing.Harness(SMFOperatorCharm)
+        self.addCleanup(harness.cleanup)
+        harness.set_model_name(name=self.namespace)
+        harness.update_config(
+            key_values={"cpu-limit": "2", "memory-limit": "1Gi", "guaranteed-qos": True}
+        )
+        harness.begin()
+
+        harness.charm.on.config_changed.emit()
+
+        charm_resources = {
+            "limits": {"cpu": "250m", "memory": "256Mi"},
+            "requests": {"cpu": "250m", "memory": "256Mi"},
+        }
+        client.patch.assert_called_with(
+            StatefulSet,
+            name="smf-operator",
+            namespace=self.namespace,
+            obj={
+                "spec": {
+                    "template": {
+                        "spec": {
+                            "containers": [
+                                {"name": "charm", "resources": charm_resources},
+                                {
+                                    "name": "smf",
+                                    "resources": {
+                                        "limits": {"cpu": "2", "memory": "1Gi"},
+                                        "requests": {"cpu": "2", "memory": "1Gi"},
+                                    },
+                                },
+                            ],
+                            "initContainers": [
+                                {"name": "charm-init", "resources": charm_resources}
+                            ],
+                        }
+                    }
+                }
+            },
+            patch_type=PatchType.STRATEGIC,
+        )
+
+    def test_given_guaranteed_qos_without_limits_when_config_changed_then_status_is_blocked(self):
+        self.harness.update_config(key_values={"guaranteed-qos": True})
+
+        self.assertEqual(
+            self.harness.model.unit.status,
+            BlockedStatus("guaranteed-qos requires cpu-limit and memory-limit"),
+        )
+
+    @patch("charm.check_output")
+    @patch("ops.model.Container.push")
+    def test_given_db_store_enabled_when_database_is_created_then_config_file_enables_db_store(
+        self,
+        patch_push,
+        patch_check_output,
+    ):
+        patch_check_output.return_value = b"1.2.3.4"
+        self.harness.update_config(key_values={"enable-db-store": True})
+        self.harness.set_can_connect(container="smf", val=True)
+
+        self._nrf_is_available()
+        self._default_database_is_available()
+        self._smf_database_is_available()
+
+        self.assertIn("  enableDBStore: true\n", patch_push.call_args.kwargs["source"])
@@ -0,0 +1,188 @@
+# Copyright 2022 Guillaume Belanger
+# See LICENSE file for licensing details.
+
+import unittest
+from unittest.mock import Mock
+
+from charms.data_platform_libs.v0.data_interfaces import (
+    DatabaseReadyEvent,
+    DatabaseRequires,
+    DatabaseRequiresEvents,
+    Diff,
+)
+from ops.charm import CharmBase
+from ops.testing import Harness
+
+METADATA = """
+name: application
+requires:
+  database:
+    interface: database
+    limit: 1
+"""
+
+
+class ApplicationCharm(CharmBase):
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.database = DatabaseRequires(
+            self,
+            relation_name="database",
+            database_name="data_platform",
+            relations_aliases=["cluster1"],
+            coalesce_events=True,
+        )
+        self.defer_ready_events = False
+        self.ready_events = []
+        self.aliased_ready_events = []
+        self.created_events = []
+        self.framework.observe(self.database.on.database_ready, self._on_database_ready)
+        self.framework.observe(
+            self.database.on.cluster1_database_ready, self._on_cluster1_database_ready
+        )
+        self.framework.observe(self.database.on.database_created, self._on_database_created)
+
+    def _on_database_ready(self, event):
+        if self.defer_ready_events:
+            event.defer()
+            return
+        self.ready_events.append(event)
+
+    def _on_cluster1_database_ready(self, event):
+        self.aliased_ready_events.append(event)
+
+    def _on_database_created(self, event):
+        self.created_events.append(event)
+
+
+class TestDatabaseRequires(unittest.TestCase):
+    def setUp(self):
+        self.harness = Harness(ApplicationCharm, meta=METADATA)
+        self.addCleanup(self.harness.cleanup)
+        self.addCleanup(self._remove_aliased_events)
+        self.harness.set_leader(True)
+        self.harness.begin()
+        self.relation_id = self.harness.add_relation("database", "database")
+        self.harness.add_relation_unit(self.relation_id, "database/0")
+
+    @staticmethod
+    def _remove_aliased_events():
+        # Aliased events are defined on the events class, once per charm instance
+        for event_name in (
+            "database_created",
+            "endpoints_changed",
+            "read_only_endpoints_changed",
+            "database_ready",
+        ):
+            delattr(DatabaseRequiresEvents, f"cluster1_{event_name}")
+
+    def test_given_credentials_and_endpoints_added_when_relation_changed_then_single_database_ready_event_is_emitted_with_diff(  # noqa: E501
+        self,
+    ):
+        self.harness.update_relation_data(
+            self.relation_id,
+            "database",
+            {"username": "user", "password": "pass", "endpoints": "host1:port,host2:port"},
+        )
+
+        self.assertEqual(len(self.harness.charm.ready_events), 1)
+        self.assertEqual(
+            self.harness.charm.ready_events[0].diff,
+            Diff({"username", "password", "endpoints"}, set(), set()),
+        )
+        self.assertEqual(self.harness.charm.created_events, [])
+
+    def test_given_relation_has_alias_when_relation_changed_then_aliased_database_ready_event_is_emitted_with_diff(  # noqa: E501
+        self,
+    ):
+        self.harness.update_relation_data(
+            self.relation_id, "database", {"username": "user", "password": "pass"}
+        )
+
+        self.assertEqual(len(self.harness.charm.aliased_ready_events), 1)
+        self.assertEqual(
+            self.harness.charm.aliased_ready_events[0].diff,
+            Diff({"username", "password"}, set(), set()),
+        )
+
+    def test_given_database_is_ready_when_endpoints_change_then_database_ready_event_carries_changed_keys(  # noqa: E501
+        self,
+    ):
+        self.harness.update_relation_data(
+            self.relation_id,
+            "database",
+            {"username": "user", "password": "pass", "endpoints": "host1:port"},
+        )
+
+        self.harness.update_relation_data(
+            self.relation_id, "database", {"endpoints": "host2:port", "tls": "True"}
+        )
+
+        self.assertEqual(len(self.harness.charm.ready_events), 2)
+        self.assertEqual(
+            self.harness.charm.ready_events[1].diff, Diff({"tls"}, {"endpoints"}, set())
+        )
+
+    def test_given_credentials_not_shared_when_relation_changed_then_database_ready_event_is_not_emitted(  # noqa: E501
+        self,
+    ):
+        self.harness.update_relation_data(
+            self.relation_id, "database", {"endpoints": "host1:port"}
+        )
+
+        self.assertEqual(self.harness.charm.ready_events, [])
+
+    def test_given_database_ready_event_when_snapshot_and_restore_then_diff_is_preserved(self):
+        relation = self.harness.model.get_relation("database", self.relation_id)
+        event = DatabaseReadyEvent(
+            Mock(), relation, app=relation.app, diff=Diff({"username"}, {"endpoints"}, {"tls"})
+        )
+        restored = DatabaseReadyEvent(Mock(), None)
+
+        restored.framework = self.harness.framework
+        restored.restore(event.snapshot())
+
+        self.assertEqual(restored.diff, Diff({"username"}, {"endpoints"}, {"tls"}))
+
+    def test_given_database_ready_event_when_connection_info_then_endpoints_and_tls_are_parsed(
+        self,
+    ):
+        self.harness.update_relation_data(
+            self.relation_id,
+            "database",
+            {
+                "username": "user",
+                "password": "pass",
+                "endpoints": "host1:port,host2:port",
+                "read-only-endpoints": "host3:port",
+                "tls": "True",
+            },
+        )
+
+        self.assertEqual(
+            self.harness.charm.ready_events[0].connection_info,
+            {
+                "username": "user",
+                "password": "pass",
+                "endpoints": ["host1:port", "host2:port"],
+                "read-only-endpoints": ["host3:port"],
+                "tls": True,
+            },
+        )
+
+    def test_given_database_ready_event_deferred_when_reemitted_then_diff_is_restored(self):
+        self.harness.charm.defer_ready_events = True
+        self.harness.update_relation_data(
+            self.relation_id,
+            "database",
+            {"username": "user", "password": "pass", "endpoints": "host1:port"},
+        )
+        self.harness.charm.defer_ready_events = False
+
+        self.harness.framework.reemit()
+
+        self.assertEqual(len(self.harness.charm.ready_events), 1)
+        self.assertEqual(
+            self.harness.charm.ready_events[0].diff,
+            Diff({"username", "password", "endpoints"}, set(), set()),
+        )
@@ -0,0 +1,153 @@
+# Copyright 2022 Guillaume Belanger
+# See LICENSE file for licensing details.
+
+import copy
+import pickle
+import unittest
+from unittest.mock import Mock, patch
+
+from charms.observability_libs.v0 import juju_topology
+from charms.observability_libs.v0.juju_topology import InvalidUUIDError, JujuTopology
+
+MODEL_UUID = "00000000-0000-4000-8000-000000000000"
+
+TOPOLOGIES = [
+    {"model": "model", "model_uuid": MODEL_UUID, "application": "app"},
+    {
+        "model": "model",
+        "model_uuid": "12345678-abcd-4ef0-9abc-def012345678",
+        "application": "smf",
+        "unit": "smf/1",
+        "charm_name": "sdcore-smf",
+    },
+    {"model": "a/b", "model_uuid": MODEL_UUID, "application": "app", "charm_name": ""},
+]
+
+
+def _reference_identifier(topology: JujuTopology) -> str:
+    """The identifier as JujuTopology computed it on every access before."""
+    parts = topology.as_dict(excluded_keys=["unit", "charm_name"])
+    parts["model_uuid"] = topology.model_uuid_short
+    return "_".join([str(val) for val in parts.values()]).replace("/", "_")
+
+
+def _reference_label_matcher_dict(topology: JujuTopology) -> dict:
+    """The label matcher dict as JujuTopology computed it on every access before."""
+    items = topology.as_dict(remapped_keys={"charm_name": "charm"}, excluded_keys=["unit"]).items()
+    return {"juju_{}".format(key): value for key, value in items if value}
+
+
+def _reference_label_matchers(topology: JujuTopology) -> str:
+    """The label matchers as JujuTopology computed them on every access before."""
+    items = _reference_label_matcher_dict(topology).items()
+    return ", ".join(['{}="{}"'.format(key, value) for key, value in items if value])
+
+
+class TestJujuTopology(unittest.TestCase):
+    def test_given_valid_model_uuid_when_init_then_topology_is_created(self):
+        topology = JujuTopology(model="model", model_uuid=MODEL_UUID, application="app")
+
+        self.assertEqual(topology.model_uuid, MODEL_UUID)
+
+    def test_given_invalid_model_uuid_when_init_then_invalid_uuid_error_is_raised(self):
+        for model_uuid in (
+            f"{MODEL_UUID}\n",
+            f" {MODEL_UUID}",
+            "ABCDEF00-0000-4000-8000-000000000000",
+            "00000000-0000-1000-8000-000000000000",
+        ):
+            with self.subTest(model_uuid=model_uuid):
+                with self.assertRaises(InvalidUUIDError):
+                    JujuTopology(model="model", model_uuid=model_uuid, application="app")
+
+
+class TestJujuTopologyDeprecationWarning(unittest.TestCase):
+    def setUp(self):
+        warned_patcher = patch.object(juju_topology, "_deprecation_warned", False)
+        warned_patcher.start()
+        self.addCleanup(warned_patcher.stop)
+        juju_topology._build_topology.cache_clear()
+
+    def test_given_constructor_is_called_when_topology_is_created_then_warning_points_at_caller(
+        self,
+    ):
+        with self.assertWarns(DeprecationWarning) as warning:
+            JujuTopology(**TOPOLOGIES[1])
+
+        self.assertEqual(warning.filename, __file__)
+
+    def test_given_from_dict_is_called_when_topology_is_created_then_warning_points_at_caller(
+        self,
+    ):
+        with self.assertWarns(DeprecationWarning) as warning:
+            JujuTopology.from_dict(TOPOLOGIES[1])
+
+        self.assertEqual(warning.filename, __file__)
+
+    def test_given_from_charm_is_called_when_topology_is_created_then_warning_points_at_caller(
+        self,
+    ):
+        charm = Mock()
+        charm.model.name = "model"
+        charm.model.uuid = MODEL_UUID
+        charm.model.app.name = "smf"
+        charm.model.unit.name = "smf/0"
+        charm.meta.name = "sdcore-smf"
+
+        with self.assertWarns(DeprecationWarning) as warning:
+            JujuTopology.from_charm(charm)
+
+        self.assertEqual(warning.filename, __file__)
+
+
+class TestJujuTopologyValueType(unittest.TestCase):
+    def test_given_topology_when_setattr_then_attribute_error_is_raised(self):
+        topology = JujuTopology(**TOPOLOGIES[1])
+
+        with self.assertRaises(AttributeError):
+            topology._model = "other"  # type: ignore[misc]
+        with self.assertRaises(AttributeError):
+            topology.extra = "value"  # type: ignore[attr-defined]
+        with self.assertRaises(AttributeError):
+            del topology._unit
+        self.assertEqual(topology.model, "model")
+
+    def test_given_equal_topologies_when_compared_then_they_are_equal_and_hash_equal(self):
+        topology = JujuTopology(**TOPOLOGIES[1])
+        same_topology = JujuTopology(**TOPOLOGIES[1])
+
+        self.assertIsNot(topology, same_topology)
+        self.assertEqual(topology, same_topology)
+        self.assertEqual(hash(topology), hash(same_topology))
+        self.assertNotEqual(topology, JujuTopology(**{**TOPOLOGIES[1], "unit": "smf/2"}))
+
+    def test_given_topology_is_dict_key_when_looked_up_with_equal_topology_then_value_is_found(
+        self,
+    ):
+        cache = {JujuTopology(**TOPOLOGIES[1]): "value"}
+
+        self.assertEqual(cache[JujuTopology(**TOPOLOGIES[1])], "value")
+        self.assertNotIn(JujuTopology(**TOPOLOGIES[0]), cache)
+
+    def test_given_topology_when_pickled_and_unpickled_then_equal_topology_is_restored(self):
+        for data in TOPOLOGIES:
+            topology = JujuTopology(**data)
+            with self.subTest(topology=topology):
+                restored = pickle.loads(pickle.dumps(topology))
+
+                self.assertEqual(restored, topology)
+                self.assertEqual(restored.identifier, topology.identifier)
+                self.assertEqual(restored.label_matchers, topology.label_matchers)
+                self.assertEqual(copy.deepcopy(topology), topology)
+
+    def test_given_topology_when_derived_values_are_read_then_they_match_on_demand_values(
+        self,
+    ):
+        for data in TOPOLOGIES:
+            topology = JujuTopology(**data)
+            with self.subTest(topology=topology):
+                self.assertEqual(topology.identifier, _reference_identifier(topology))
+                self.assertEqual(
+                    topology.label_matcher_dict, _reference_label_matcher_dict(topology)
+                )
+                self.assertEqual(topology.label_matchers, _reference_label_matchers(topology))
@@ -0,0 +1,153 @@
+# Copyright 2022 Guillaume Belanger
+# See LICENSE file for licensing details.
+
+import unittest
+from unittest.mock import Mock, mock_open, patch
+
+from charms.observability_libs.v1 import kubernetes_service_patch
+from charms.observability_libs.v1.kubernetes_service_patch import (
+    NAMESPACE_FILE,
+    KubernetesServicePatch,
+    _read_namespace,
+)
+from lightkube.models.core_v1 import ServicePort, ServiceSpec
+from lightkube.resources.core_v1 import Service
+from ops.charm import CharmBase
+from ops.testing import Harness
+
+METADATA = """
+name: test-charm
+"""
+
+
+class PatchedCharm(CharmBase):
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.service_patcher = KubernetesServicePatch(
+            self,
+            [ServicePort(8805, name="pfcp", protocol="UDP")],
+            service_name="test-charm-pfcp",
+            service_type="LoadBalancer",
+            server_side_apply=True,
+            field_manager="test-manager",
+        )
+
+
+class TwoPatchesCharm(CharmBase):
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.service_patcher = KubernetesServicePatch(
+            self, [ServicePort(80, name="http")], server_side_apply=True
+        )
+        self.pfcp_service_patcher = KubernetesServicePatch(
+            self,
+            [ServicePort(8805, name="pfcp", protocol="UDP")],
+            service_name="test-charm-pfcp",
+            server_side_apply=True,
+        )
+
+
+class TestKubernetesServicePatchClient(unittest.TestCase):
+    def setUp(self):
+        client_patcher = patch.object(kubernetes_service_patch, "_client", None)
+        client_patcher.start()
+        self.addCleanup(client_patcher.stop)
+        self.patch_client = patch.object(kubernetes_service_patch, "Client").start()
+        self.patch_open = patch.object(
+            kubernetes_service_patch,
+            "open",
+            mock_open(read_data="test-namespace\n"),
+            create=True,
+        ).start()
+        self.addCleanup(patch.stopall)
+        _read_namespace.cache_clear()
+        self.addCleanup(_read_namespace.cache_clear)
+
+    def _begin(self) -> Harness:
+        harness = Harness(TwoPatchesCharm, meta=METADATA)
+        self.addCleanup(harness.cleanup)
+        harness.begin()
+        return harness
+
+    def test_given_several_patchers_and_hooks_when_patch_then_one_client_is_created(self):
+        harness = self._begin()
+        harness.charm.on.install.emit()
+        harness.charm.on.upgrade_charm.emit()
+        self._begin().charm.on.upgrade_charm.emit()
+
+        self.patch_client.assert_called_once_with()
+        self.assertEqual(self.patch_client.return_value.apply.call_count, 6)
+
+    def test_given_several_patchers_when_namespace_is_read_then_namespace_file_is_read_once(
+        self,
+    ):
+        harness = self._begin()
+        harness.charm.on.install.emit()
+
+        namespaces = [
+            harness.charm.service_patcher._namespace,
+            harness.charm.pfcp_service_patcher._namespace,
+            self._begin().charm.service_patcher._namespace,
+        ]
+
+        self.patch_open.assert_called_once_with(NAMESPACE_FILE, "r")
+        self.assertEqual(namespaces, ["test-namespace"] * 3)
+
+
+class PatchedCharmTestCase(unittest.TestCase):
+    def setUp(self):
+        self.patch_read_namespace = patch(
+            "charms.observability_libs.v1.kubernetes_service_patch._read_namespace",
+            Mock(return_value="test-namespace"),
+        )
+        self.patch_read_namespace.start()
+        self.addCleanup(self.patch_read_namespace.stop)
+        self.patch_get_client = patch(
+            "charms.observability_libs.v1.kubernetes_service_patch._get_client"
+        )
+        self.client = self.patch_get_client.start().return_value
+        self.addCleanup(self.patch_get_client.stop)
+        self.harness = Harness(PatchedCharm, meta=METADATA)
+        self.addCleanup(self.harness.cleanup)
+        self.harness.begin()
+
+
+class TestKubernetesServicePatchServerSideApply(PatchedCharmTestCase):
+    def test_given_server_side_apply_when_install_then_service_is_applied_with_field_manager(
+        self,
+    ):
+        self.harness.charm.on.install.emit()
+
+        self.client.apply.assert_called_once_with(
+            self.harness.charm.service_patcher.service, field_manager="test-manager", force=True
+        )
+
+    def test_given_server_side_apply_when_install_then_service_is_not_deleted_nor_created(self):
+        self.harness.charm.on.install.emit()
+
+        self.client.get.assert_not_called()
+        self.client.delete.assert_not_called()
+        self.client.create.assert_not_called()
+        self.client.patch.assert_not_called()
+
+
+class TestKubernetesServicePatchIsPatched(PatchedCharmTestCase):
+    def test_given_live_service_port_has_other_protocol_when_is_patched_then_returns_false(self):
+        self.client.get.return_value = Service(
+            spec=ServiceSpec(ports=[ServicePort(8805, name="pfcp", protocol="TCP")])
+        )
+
+        self.assertFalse(self.harness.charm.service_patcher.is_patched())
+
+    def test_given_live_service_port_has_same_protocol_when_is_patched_then_returns_true(self):
+        self.client.get.return_value = Service(
+            spec=ServiceSpec(ports=[ServicePort(8805, name="pfcp", protocol="UDP")])
+        )
+
+        self.assertTrue(self.harness.charm.service_patcher.is_patched())
+
+    def test_given_port_without_protocol_when_port_key_then_protocol_defaults_to_tcp(self):
+        self.assertEqual(
+            KubernetesServicePatch._port_key(ServicePort(80, name="http")),
+            KubernetesServicePatch._port_key(ServicePort(80, name="http", protocol="TCP")),
+        )
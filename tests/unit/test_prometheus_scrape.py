@@ -0,0 +1,815 @@
+# Copyright 2022 Guillaume Belanger
+# See LICENSE file for licensing details.
+
+import gc
+import json
+import os
+import re
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+from unittest.mock import Mock, patch
+
+import yaml
+from charms.prometheus_k8s.v0 import prometheus_scrape
+from charms.prometheus_k8s.v0.prometheus_scrape import (
+    AlertRules,
+    CosTool,
+    MetricsEndpointAggregator,
+    MetricsEndpointConsumer,
+    MetricsEndpointProvider,
+    PromQLParseError,
+    _canonical_json,
+    _promql_closing_index,
+    _promql_inject_label_matchers,
+    _promql_string_end,
+)
+from ops.charm import CharmBase
+from ops.testing import Harness
+
+TOPOLOGY = {"juju_model": "model", "juju_application": "app"}
+MATCHERS = 'juju_model="model",juju_application="app"'
+
+# Expressions and the result of injecting the TOPOLOGY label matchers in them
+PROMQL_CORPUS = [
+    ("up < 1", f"up{{{MATCHERS}}} < 1"),
+    ("up{} == 0", f"up{{{MATCHERS}}} == 0"),
+    ('up{job="x"} == 0', f'up{{job="x",{MATCHERS}}} == 0'),
+    ('up{juju_model="other"}', f"up{{{MATCHERS}}}"),
+    (
+        'rate(http_requests_total{code=~"5..", juju_model!="other"}[5m]) > 0.1',
+        f'rate(http_requests_total{{code=~"5..",{MATCHERS}}}[5m]) > 0.1',
+    ),
+    (
+        "sum by (le) (rate(smf_latency_bucket[5m]))",
+        f"sum by (le) (rate(smf_latency_bucket{{{MATCHERS}}}[5m]))",
+    ),
+    (
+        "sum(rate(a[1m])) without (instance, pod) / on(job) group_left(le) b",
+        f"sum(rate(a{{{MATCHERS}}}[1m])) without (instance, pod) / on(job) group_left(le) "
+        f"b{{{MATCHERS}}}",
+    ),
+    (
+        "histogram_quantile(0.99, sum by (le, upf) (rate(x_bucket[5m:1m] offset 1h)))",
+        f"histogram_quantile(0.99, sum by (le, upf) (rate(x_bucket{{{MATCHERS}}}[5m:1m] "
+        "offset 1h)))",
+    ),
+    (
+        'label_replace(up, "dst", "$1", "src", "(.*)")',
+        f'label_replace(up{{{MATCHERS}}}, "dst", "$1", "src", "(.*)")',
+    ),
+    (
+        'absent(up{job="smf"}) or vector(1)',
+        f'absent(up{{job="smf",{MATCHERS}}}) or vector(1)',
+    ),
+    (
+        "a > bool 5 unless c @ start()",
+        f"a{{{MATCHERS}}} > bool 5 unless c{{{MATCHERS}}} @ start()",
+    ),
+    (
+        'count_values("version", build_info) > Inf',
+        f'count_values("version", build_info{{{MATCHERS}}}) > Inf',
+    ),
+    (
+        'foo:bar:rate5m{x="}{"} * 2e3 - .5',
+        f'foo:bar:rate5m{{x="}}{{",{MATCHERS}}} * 2e3 - .5',
+    ),
+    ('{__name__=~"smf_.*"}', f'{{__name__=~"smf_.*",{MATCHERS}}}'),
+    ("topk(5, smf_sessions) # up\n", f"topk(5, smf_sessions{{{MATCHERS}}}) # up\n"),
+    (
+        "max_over_time(deriv(rate(distance_covered_total[5s])[30s:5s])[10m:])",
+        f"max_over_time(deriv(rate(distance_covered_total{{{MATCHERS}}}[5s])[30s:5s])[10m:])",
+    ),
+]
+
+PROMQL_UNPARSABLE = ['up{job="x"', "rate(up[5m)", 'up{a="b}']
+
+_MATCHER = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)\s*(=~|!~|!=|=)\s*("(?:\\.|[^"\\])*")')
+
+
+def _selector_matchers(expression: str) -> list:
+    """Returns the set of label matchers of each selector block of an expression, in order."""
+    selectors = []
+    index = 0
+    while index < len(expression):
+        if expression[index] in "\"'`":
+            index = _promql_string_end(expression, index)
+        elif expression[index] == "{":
+            start, index = index + 1, _promql_closing_index(expression, index, "}")
+            selectors.append(set(_MATCHER.findall(expression[start:index])))
+            index += 1
+        else:
+            index += 1
+    return selectors
+
+
+class TestPromQLInjectLabelMatchers(unittest.TestCase):
+    def test_given_expression_when_inject_label_matchers_then_matchers_are_added_to_every_selector(  # noqa: E501
+        self,
+    ):
+        for expression, expected in PROMQL_CORPUS:
+            with self.subTest(expression=expression):
+                self.assertEqual(_promql_inject_label_matchers(expression, TOPOLOGY), expected)
+
+    def test_given_unterminated_expression_when_inject_label_matchers_then_parse_error_is_raised(  # noqa: E501
+        self,
+    ):
+        for expression in PROMQL_UNPARSABLE:
+            with self.subTest(expression=expression):
+                with self.assertRaises(PromQLParseError):
+                    _promql_inject_label_matchers(expression, TOPOLOGY)
+
+
+class TestPromQLInjectLabelMatchersAgainstCosTool(unittest.TestCase):
+    def setUp(self):
+        self.cos_tool_path = CosTool(None).path
+        if not self.cos_tool_path:
+            self.skipTest("cos-tool binary not found")
+
+    def test_given_expression_when_inject_label_matchers_then_selectors_match_cos_tool_ones(
+        self,
+    ):
+        for expression, _ in PROMQL_CORPUS:
+            with self.subTest(expression=expression):
+                args = [str(self.cos_tool_path), "transform"]
+                args.extend(f"--label-matcher={key}={value}" for key, value in TOPOLOGY.items())
+                cos_tool_output = subprocess.run(
+                    [*args, expression], check=True, capture_output=True, text=True
+                ).stdout
+
+                self.assertEqual(
+                    _selector_matchers(_promql_inject_label_matchers(expression, TOPOLOGY)),
+                    _selector_matchers(cos_tool_output),
+                )
+
+
+class TestCosTool(unittest.TestCase):
+    def setUp(self):
+        self.cos_tool = CosTool(None)
+        self.cos_tool._path = Path("/usr/bin/cos-tool")
+
+    @patch("charms.prometheus_k8s.v0.prometheus_scrape._promql_inject_label_matchers")
+    @patch("subprocess.Popen")
+    def test_given_cos_tool_cannot_be_executed_when_inject_label_matchers_batch_then_expressions_are_unchanged(  # noqa: E501
+        self, patch_popen, patch_inject_label_matchers
+    ):
+        patch_inject_label_matchers.side_effect = PromQLParseError("unsupported")
+        patch_popen.side_effect = PermissionError("Permission denied")
+
+        transformed = self.cos_tool.inject_label_matchers_batch(
+            [("up", TOPOLOGY), ("rate(x[5m])", TOPOLOGY)]
+        )
+
+        self.assertEqual(transformed, ["up", "rate(x[5m])"])
+
+    @patch.object(CosTool, "_validate_alert_rules", Mock(return_value=(True, "")))
+    @patch.object(CosTool, "_validation_cache", {})
+    @patch.object(CosTool, "_validation_cache_size", 2)
+    def test_given_validation_cache_is_full_when_validate_alert_rules_then_least_recently_used_result_is_evicted(  # noqa: E501
+        self,
+    ):
+        charm_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(charm_dir.cleanup)
+        cos_tool = CosTool(Mock(charm_dir=charm_dir.name))
+        cos_tool._path = Path("/usr/bin/cos-tool")
+        cache_path = Path(charm_dir.name) / ".cos-tool-validation-cache"
+        rules = [{"groups": [{"name": f"group-{index}", "rules": []}]} for index in range(3)]
+        digests = [cos_tool._validation_digest(group) for group in rules]
+        for age, group in enumerate(rules[:2]):
+            cos_tool.validate_alert_rules(group)
+            os.utime(cache_path / digests[age], ns=(age, age))
+
+        cos_tool.validate_alert_rules(rules[2])
+
+        self.assertEqual(sorted(entry.name for entry in cache_path.iterdir()), sorted(digests[1:]))
+
+    @patch.object(CosTool, "_validate_alert_rules")
+    @patch.object(CosTool, "_validation_cache", {})
+    def test_given_cached_result_cannot_be_touched_when_validate_alert_rules_then_cached_result_is_returned(  # noqa: E501
+        self, patch_validate_alert_rules
+    ):
+        charm_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(charm_dir.cleanup)
+        cos_tool = CosTool(Mock(charm_dir=charm_dir.name))
+        cos_tool._path = Path("/usr/bin/cos-tool")
+        rules = {"groups": [{"name": "group", "rules": []}]}
+        cos_tool._cache_validation(cos_tool._validation_digest(rules), False, "invalid rule")
+        CosTool._validation_cache.clear()
+
+        with patch.object(Path, "touch", side_effect=PermissionError("Read-only file system")):
+            result = cos_tool.validate_alert_rules(rules)
+
+        self.assertEqual(result, (False, "invalid rule"))
+        patch_validate_alert_rules.assert_not_called()
+
+
+PROVIDER_METADATA = """
+name: provider
+provides:
+  metrics-endpoint:
+    interface: prometheus_scrape
+"""
+
+ALERT_RULES = {"groups": [{"name": "smf", "rules": [{"alert": "SMFDown", "expr": "up == 0"}]}]}
+
+
+def _network(address: str) -> dict:
+    return {
+        "bind-addresses": [
+            {"interface-name": "eth0", "addresses": [{"cidr": "10.0.0.0/24", "value": address}]}
+        ],
+        "egress-subnets": ["10.0.0.0/24"],
+        "ingress-addresses": [address],
+    }
+
+
+class ProviderCharm(CharmBase):
+    alert_rules_path = "prometheus_alert_rules"
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.provider = MetricsEndpointProvider(
+            self,
+            jobs=[{"static_configs": [{"targets": ["*:9089"]}]}],
+            alert_rules_path=self.alert_rules_path,
+            refresh_event=self.on.update_status,
+        )
+
+
+class TestMetricsEndpointProvider(unittest.TestCase):
+    def setUp(self):
+        alert_rules_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(alert_rules_dir.cleanup)
+        self.alert_rules_file = Path(alert_rules_dir.name) / "smf.rules"
+        self.alert_rules_file.write_text(yaml.safe_dump(ALERT_RULES))
+        alert_rules_path_patcher = patch.object(
+            ProviderCharm, "alert_rules_path", alert_rules_dir.name
+        )
+        alert_rules_path_patcher.start()
+        self.addCleanup(alert_rules_path_patcher.stop)
+        self.harness = Harness(ProviderCharm, meta=PROVIDER_METADATA)
+        self.addCleanup(self.harness.cleanup)
+        self.harness.set_leader(True)
+        self.harness.begin()
+        network_get_patcher = patch.object(
+            self.harness._backend, "network_get", return_value=_network("10.0.0.10")
+        )
+        self.patch_network_get = network_get_patcher.start()
+        self.addCleanup(network_get_patcher.stop)
+        self.relation_id = self.harness.add_relation("metrics-endpoint", "prometheus")
+        self.harness.add_relation_unit(self.relation_id, "prometheus/0")
+        update_relation_data_patcher = patch.object(
+            self.harness._backend,
+            "update_relation_data",
+            wraps=self.harness._backend.update_relation_data,
+        )
+        self.patch_update_relation_data = update_relation_data_patcher.start()
+        self.addCleanup(update_relation_data_patcher.stop)
+
+    def _written_keys(self) -> list:
+        """Returns the relation data keys written since the relation was joined, in order."""
+        return [call.args[2] for call in self.patch_update_relation_data.call_args_list]
+
+    def test_given_relation_data_is_published_when_refresh_event_then_nothing_is_written(self):
+        self.harness.charm.on.update_status.emit()
+
+        self.assertEqual(self._written_keys(), [])
+
+    def test_given_relation_data_is_published_when_scrape_jobs_change_then_only_scrape_jobs_are_written(  # noqa: E501
+        self,
+    ):
+        self.harness.charm.provider.update_scrape_job_spec(
+            [{"static_configs": [{"targets": ["*:9090"]}]}]
+        )
+
+        self.assertEqual(self._written_keys(), ["scrape_jobs"])
+        self.assertIn(
+            "*:9090",
+            self.harness.get_relation_data(self.relation_id, "provider")["scrape_jobs"],
+        )
+
+    def test_given_relation_data_is_published_when_unit_address_changes_then_only_unit_address_is_written(  # noqa: E501
+        self,
+    ):
+        self.patch_network_get.return_value = _network("10.0.0.11")
+        # network info is only fetched once per hook
+        self.harness.model._bindings._data.clear()
+
+        self.harness.charm.on.update_status.emit()
+
+        self.assertEqual(self._written_keys(), ["prometheus_scrape_unit_address"])
+        self.assertEqual(
+            self.harness.get_relation_data(self.relation_id, "provider/0")[
+                "prometheus_scrape_unit_address"
+            ],
+            "10.0.0.11",
+        )
+
+    @patch.object(AlertRules, "add_path")
+    def test_given_alert_rules_are_published_when_rule_files_are_unchanged_then_rules_are_not_read_again(  # noqa: E501
+        self, patch_add_path
+    ):
+        self.harness.charm.on.update_status.emit()
+
+        patch_add_path.assert_not_called()
+
+    @patch.object(AlertRules, "add_path", autospec=True, side_effect=AlertRules.add_path)
+    def test_given_alert_rules_are_published_when_rule_file_modification_time_changes_then_rules_are_read_again(  # noqa: E501
+        self, patch_add_path
+    ):
+        stat = self.alert_rules_file.stat()
+        os.utime(self.alert_rules_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+
+        self.harness.charm.on.update_status.emit()
+
+        patch_add_path.assert_called_once()
+
+    def test_given_alert_rules_are_published_when_rule_file_size_changes_then_new_rules_are_published(  # noqa: E501
+        self,
+    ):
+        stat = self.alert_rules_file.stat()
+        alert_rules = {"groups": [{**ALERT_RULES["groups"][0], "name": "smf-sessions"}]}
+        self.alert_rules_file.write_text(yaml.safe_dump(alert_rules))
+        os.utime(self.alert_rules_file, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+        self.harness.charm.on.update_status.emit()
+
+        self.assertIn(
+            "smf-sessions",
+            self.harness.get_relation_data(self.relation_id, "provider")["alert_rules"],
+        )
+
+
+CONSUMER_METADATA = """
+name: prometheus
+requires:
+  metrics-endpoint:
+    interface: prometheus_scrape
+"""
+
+
+class ConsumerCharm(CharmBase):
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.consumer = MetricsEndpointConsumer(self)
+
+
+class TestMetricsEndpointConsumer(unittest.TestCase):
+    def setUp(self):
+        self.harness = Harness(ConsumerCharm, meta=CONSUMER_METADATA)
+        self.addCleanup(self.harness.cleanup)
+        self.harness.begin()
+        self.relation_ids = [self._add_provider(f"provider{index}") for index in range(2)]
+        self.static_scrape_config = Mock(wraps=self.harness.charm.consumer._static_scrape_config)
+        self.harness.charm.consumer._static_scrape_config = self.static_scrape_config
+
+    def _add_provider(self, app: str) -> int:
+        relation_id = self.harness.add_relation("metrics-endpoint", app)
+        self.harness.add_relation_unit(relation_id, f"{app}/0")
+        self.harness.update_relation_data(
+            relation_id,
+            app,
+            {
+                "scrape_jobs": json.dumps([{"static_configs": [{"targets": ["*:9089"]}]}]),
+                "scrape_metadata": json.dumps(
+                    {
+                        "model": "model",
+                        "model_uuid": "00000000-0000-4000-8000-000000000000",
+                        "application": app,
+                        "unit": f"{app}/0",
+                        "charm_name": app,
+                    }
+                ),
+            },
+        )
+        self.harness.update_relation_data(
+            relation_id, f"{app}/0", {"prometheus_scrape_unit_address": "10.0.0.1"}
+        )
+        return relation_id
+
+    def _targets(self) -> list:
+        return sorted(
+            target
+            for job in self.harness.charm.consumer.jobs()
+            for static_config in job["static_configs"]
+            for target in static_config["targets"]
+        )
+
+    def test_given_jobs_were_computed_when_jobs_then_cached_jobs_are_returned(self):
+        expected = self.harness.charm.consumer.jobs()
+        self.static_scrape_config.reset_mock()
+
+        self.assertEqual(self.harness.charm.consumer.jobs(), expected)
+        self.static_scrape_config.assert_not_called()
+
+    def test_given_jobs_were_computed_when_relation_changed_then_only_its_jobs_are_recomputed(
+        self,
+    ):
+        self.harness.charm.consumer.jobs()
+        self.static_scrape_config.reset_mock()
+
+        self.harness.update_relation_data(
+            self.relation_ids[1], "provider1/0", {"prometheus_scrape_unit_address": "10.0.0.2"}
+        )
+
+        self.assertEqual(self._targets(), ["10.0.0.1:9089", "10.0.0.2:9089"])
+        self.assertEqual(
+            [call.args[0].id for call in self.static_scrape_config.call_args_list],
+            [self.relation_ids[1]],
+        )
+
+    def test_given_jobs_were_computed_when_relation_departed_then_unit_jobs_are_removed(self):
+        self.harness.charm.consumer.jobs()
+
+        self.harness.remove_relation_unit(self.relation_ids[1], "provider1/0")
+
+        self.assertEqual(self._targets(), ["10.0.0.1:9089"])
+
+    def test_given_jobs_were_computed_when_relation_is_removed_then_its_cached_jobs_are_pruned(
+        self,
+    ):
+        self.harness.charm.consumer.jobs()
+
+        self.harness.remove_relation(self.relation_ids[1])
+        self.harness.charm.consumer.jobs()
+
+        self.assertEqual(
+            list(self.harness.charm.consumer._stored.scrape_jobs_by_relation.keys()),
+            [str(self.relation_ids[0])],
+        )
+
+    def test_given_jobs_were_computed_when_upgrade_charm_then_cached_jobs_are_dropped(self):
+        self.harness.charm.consumer.jobs()
+
+        self.harness.charm.on.upgrade_charm.emit()
+
+        self.assertEqual(dict(self.harness.charm.consumer._stored.scrape_jobs_by_relation), {})
+
+
+AGGREGATOR_METADATA = """
+name: aggregator
+provides:
+  downstream-prometheus-scrape:
+    interface: prometheus_scrape
+requires:
+  prometheus-target:
+    interface: http
+  prometheus-rules:
+    interface: prometheus-rules
+"""
+
+
+class AggregatorCharm(CharmBase):
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.aggregator = MetricsEndpointAggregator(self)
+
+
+class TestMetricsEndpointAggregator(unittest.TestCase):
+    def setUp(self):
+        self.harness = Harness(AggregatorCharm, meta=AGGREGATOR_METADATA)
+        self.addCleanup(self.harness.cleanup)
+        self.harness.set_model_name("model")
+        self.harness.set_leader(True)
+        self.harness.begin()
+        self.prometheus_relation_id = self._add_prometheus("prometheus")
+
+    def _add_prometheus(self, app: str) -> int:
+        relation_id = self.harness.add_relation("downstream-prometheus-scrape", app)
+        self.harness.add_relation_unit(relation_id, f"{app}/0")
+        return relation_id
+
+    def _add_targets(self, app: str, hostnames: list) -> int:
+        relation_id = self.harness.add_relation("prometheus-target", app)
+        for index, hostname in enumerate(hostnames):
+            self.harness.add_relation_unit(relation_id, f"{app}/{index}")
+            self.harness.update_relation_data(
+                relation_id, f"{app}/{index}", {"hostname": hostname, "port": "9089"}
+            )
+        return relation_id
+
+    def _add_alert_rules(self, app: str, alerts: list) -> int:
+        relation_id = self.harness.add_relation("prometheus-rules", app)
+        for index, unit_alerts in enumerate(alerts):
+            unit_name = f"{app}/{index}"
+            self.harness.add_relation_unit(relation_id, unit_name)
+            rules = [
+                {"alert": alert, "expr": "up == 0", "labels": {"severity": "critical"}}
+                for alert in unit_alerts
+            ]
+            self.harness.update_relation_data(
+                relation_id, unit_name, {"groups": yaml.safe_dump(rules)}
+            )
+        return relation_id
+
+    def _reload_aggregator(self):
+        """Instantiates the aggregator again, as in the next hook, from its stored state."""
+        self.harness.framework.commit()
+        del self.harness.charm.aggregator
+        gc.collect()
+        self.harness.charm.aggregator = MetricsEndpointAggregator(self.harness.charm)
+
+    def _scrape_jobs(self, relation_id: int) -> str:
+        return self.harness.get_relation_data(relation_id, "aggregator")["scrape_jobs"]
+
+    def _alert_rules(self, relation_id: int) -> str:
+        return self.harness.get_relation_data(relation_id, "aggregator")["alert_rules"]
+
+    def _unit_alerts(self, relation_id: int) -> dict:
+        return {
+            group["name"]: sorted(
+                (rule["labels"]["juju_unit"], rule["alert"]) for rule in group["rules"]
+            )
+            for group in json.loads(self._alert_rules(relation_id)).get("groups", [])
+        }
+
+    def _job_targets(self, relation_id: int) -> dict:
+        return {
+            job["job_name"]: sorted(config["targets"][0] for config in job["static_configs"])
+            for job in json.loads(self._scrape_jobs(relation_id))
+        }
+
+    def test_given_targets_when_target_relation_changed_then_scrape_jobs_are_published(self):
+        self._add_targets("smf", ["10.0.0.1", "10.0.0.2"])
+
+        job_name = self.harness.charm.aggregator._job_name("smf")
+        self.assertEqual(
+            self._job_targets(self.prometheus_relation_id),
+            {job_name: ["10.0.0.1:9089", "10.0.0.2:9089"]},
+        )
+
+    def test_given_targets_when_target_address_changes_then_job_is_replaced(self):
+        self._add_targets("nrf", ["10.0.1.1"])
+        relation_id = self._add_targets("smf", ["10.0.0.1", "10.0.0.2"])
+        self._add_targets("upf", ["10.0.2.1"])
+
+        self.harness.update_relation_data(relation_id, "smf/1", {"hostname": "10.0.0.3"})
+
+        aggregator = self.harness.charm.aggregator
+        self.assertEqual(
+            self._job_targets(self.prometheus_relation_id),
+            {
+                aggregator._job_name("nrf"): ["10.0.1.1:9089"],
+                aggregator._job_name("upf"): ["10.0.2.1:9089"],
+                aggregator._job_name("smf"): ["10.0.0.1:9089", "10.0.0.3:9089"],
+            },
+        )
+
+    def test_given_targets_when_unit_departs_then_its_static_config_is_removed(self):
+        relation_id = self._add_targets("smf", ["10.0.0.1", "10.0.0.2"])
+
+        self.harness.remove_relation_unit(relation_id, "smf/0")
+
+        job_name = self.harness.charm.aggregator._job_name("smf")
+        self.assertEqual(
+            self._job_targets(self.prometheus_relation_id), {job_name: ["10.0.0.2:9089"]}
+        )
+
+    def test_given_targets_when_last_unit_departs_then_job_is_removed(self):
+        relation_id = self._add_targets("smf", ["10.0.0.1"])
+
+        self.harness.remove_relation_unit(relation_id, "smf/0")
+
+        self.assertEqual(self._scrape_jobs(self.prometheus_relation_id), "[]")
+
+    def test_given_targets_when_prometheus_joins_then_it_gets_the_same_scrape_jobs(self):
+        self._add_targets("smf", ["10.0.0.1", "10.0.0.2"])
+        self._add_targets("nrf", ["10.0.1.1"])
+
+        relation_id = self._add_prometheus("prometheus-2")
+
+        self.assertEqual(
+            self._scrape_jobs(relation_id), self._scrape_jobs(self.prometheus_relation_id)
+        )
+
+    def test_given_targets_when_scrape_jobs_are_published_then_blob_is_canonical_json(self):
+        self._add_targets("smf", ["10.0.0.1", "10.0.0.2"])
+        self._add_targets("nrf", ["10.0.1.1"])
+
+        scrape_jobs = self._scrape_jobs(self.prometheus_relation_id)
+
+        self.assertEqual(scrape_jobs, _canonical_json(json.loads(scrape_jobs)))
+
+    def test_given_jobs_stored_in_previous_format_when_aggregator_is_initialised_then_jobs_are_migrated(  # noqa: E501
+        self,
+    ):
+        self._add_targets("smf", ["10.0.0.1", "10.0.0.2"])
+        self._add_targets("nrf", ["10.0.1.1"])
+        scrape_jobs = self._scrape_jobs(self.prometheus_relation_id)
+        self.harness.charm.aggregator._stored.jobs = json.loads(scrape_jobs)
+        self.harness.charm.aggregator._stored.jobs_by_name = {}
+
+        self._reload_aggregator()
+
+        self.assertEqual(list(self.harness.charm.aggregator._stored.jobs), [])
+        self.assertEqual(self.harness.charm.aggregator._scrape_jobs_blob(), scrape_jobs)
+
+    def test_given_alert_rules_when_rules_relation_changed_then_alert_rules_are_published(self):
+        self._add_alert_rules("smf", [["SMFDown"], ["SMFDown", "SMFOverloaded"]])
+
+        group_name = self.harness.charm.aggregator.group_name("smf")
+        self.assertEqual(
+            self._unit_alerts(self.prometheus_relation_id),
+            {
+                group_name: [
+                    ("smf/0", "SMFDown"),
+                    ("smf/1", "SMFDown"),
+                    ("smf/1", "SMFOverloaded"),
+                ]
+            },
+        )
+
+    def test_given_alert_rules_when_rules_change_again_then_rules_are_not_duplicated(self):
+        relation_id = self._add_alert_rules("smf", [["SMFDown"]])
+
+        self.harness.update_relation_data(relation_id, "smf/0", {"other": "data"})
+
+        group_name = self.harness.charm.aggregator.group_name("smf")
+        self.assertEqual(
+            self._unit_alerts(self.prometheus_relation_id), {group_name: [("smf/0", "SMFDown")]}
+        )
+
+    def test_given_alert_rules_when_unit_departs_then_its_rules_are_removed(self):
+        relation_id = self._add_alert_rules("smf", [["SMFDown"], ["SMFDown", "SMFOverloaded"]])
+
+        self.harness.remove_relation_unit(relation_id, "smf/1")
+
+        group_name = self.harness.charm.aggregator.group_name("smf")
+        self.assertEqual(
+            self._unit_alerts(self.prometheus_relation_id), {group_name: [("smf/0", "SMFDown")]}
+        )
+
+    def test_given_alert_rules_when_last_unit_departs_then_group_is_removed(self):
+        relation_id = self._add_alert_rules("smf", [["SMFDown"]])
+
+        self.harness.remove_relation_unit(relation_id, "smf/0")
+
+        self.assertEqual(self._alert_rules(self.prometheus_relation_id), "{}")
+
+    def test_given_alert_rules_when_prometheus_joins_then_it_gets_the_same_alert_rules(self):
+        self._add_alert_rules("smf", [["SMFDown"], ["SMFOverloaded"]])
+        self._add_alert_rules("nrf", [["NRFDown"]])
+
+        relation_id = self._add_prometheus("prometheus-2")
+
+        self.assertEqual(
+            self._alert_rules(relation_id), self._alert_rules(self.prometheus_relation_id)
+        )
+
+    def test_given_alert_rules_when_alert_rules_are_published_then_blob_is_canonical_json(self):
+        self._add_alert_rules("smf", [["SMFDown"], ["SMFOverloaded"]])
+        self._add_alert_rules("nrf", [["NRFDown"]])
+
+        alert_rules = self._alert_rules(self.prometheus_relation_id)
+
+        self.assertEqual(alert_rules, _canonical_json(json.loads(alert_rules)))
+
+    def test_given_alert_rules_stored_in_previous_format_when_aggregator_is_initialised_then_alert_rules_are_migrated(  # noqa: E501
+        self,
+    ):
+        self._add_alert_rules("smf", [["SMFDown"], ["SMFOverloaded"]])
+        self._add_alert_rules("nrf", [["NRFDown"]])
+        alert_rules = self._alert_rules(self.prometheus_relation_id)
+        self.harness.charm.aggregator._stored.alert_rules = json.loads(alert_rules)["groups"]
+        self.harness.charm.aggregator._stored.alert_rule_groups = {}
+
+        self._reload_aggregator()
+
+        self.assertEqual(list(self.harness.charm.aggregator._stored.alert_rules), [])
+        self.assertEqual(self.harness.charm.aggregator._alert_rules_blob(), alert_rules)
+
+
+class ResolvingAggregatorCharm(CharmBase):
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.aggregator = MetricsEndpointAggregator(self, resolve_addresses=True)
+
+
+class TestMetricsEndpointAggregatorDNSResolution(unittest.TestCase):
+    def setUp(self):
+        self.slow_hostnames = set()
+        self.release_slow_lookups = threading.Event()
+        self.addCleanup(self.release_slow_lookups.set)
+        gethostbyaddr_patcher = patch("socket.gethostbyaddr", side_effect=self._gethostbyaddr)
+        self.patch_gethostbyaddr = gethostbyaddr_patcher.start()
+        self.addCleanup(gethostbyaddr_patcher.stop)
+        timeout_patcher = patch.object(prometheus_scrape, "DNS_LOOKUP_TIMEOUT", 0.2)
+        timeout_patcher.start()
+        self.addCleanup(timeout_patcher.stop)
+        self.harness = Harness(ResolvingAggregatorCharm, meta=AGGREGATOR_METADATA)
+        self.addCleanup(self.harness.cleanup)
+        self.harness.set_leader(True)
+        self.harness.begin()
+        self.prometheus_relation_id = self.harness.add_relation(
+            "downstream-prometheus-scrape", "prometheus"
+        )
+        self.harness.add_relation_unit(self.prometheus_relation_id, "prometheus/0")
+
+    def _gethostbyaddr(self, hostname: str) -> tuple:
+        if hostname in self.slow_hostnames:
+            self.release_slow_lookups.wait()
+        return f"host-{hostname}", [], [hostname]
+
+    def _add_targets(self, app: str, hostnames: list) -> int:
+        relation_id = self.harness.add_relation("prometheus-target", app)
+        for index, hostname in enumerate(hostnames):
+            self.harness.add_relation_unit(relation_id, f"{app}/{index}")
+            self.harness.update_relation_data(
+                relation_id, f"{app}/{index}", {"hostname": hostname, "port": "9089"}
+            )
+        return relation_id
+
+    def _reload_aggregator(self):
+        """Instantiates the aggregator again, as in the next hook, from its stored state."""
+        self.harness.framework.commit()
+        del self.harness.charm.aggregator
+        gc.collect()
+        self.harness.charm.aggregator = MetricsEndpointAggregator(
+            self.harness.charm, resolve_addresses=True
+        )
+
+    def _dns_names(self) -> dict:
+        scrape_jobs = self.harness.get_relation_data(self.prometheus_relation_id, "aggregator")[
+            "scrape_jobs"
+        ]
+        return {
+            config["targets"][0]: config["labels"]["dns_name"]
+            for job in json.loads(scrape_jobs)
+            for config in job["static_configs"]
+        }
+
+    def _lookups(self, hostname: str) -> int:
+        return [call.args[0] for call in self.patch_gethostbyaddr.call_args_list].count(hostname)
+
+    def test_given_lookup_exceeds_time_budget_when_targets_change_then_address_is_used_as_dns_name(  # noqa: E501
+        self,
+    ):
+        self.slow_hostnames.add("10.0.0.2")
+
+        self._add_targets("smf", ["10.0.0.1", "10.0.0.2"])
+
+        self.assertEqual(
+            self._dns_names(),
+            {"10.0.0.1:9089": "host-10.0.0.1", "10.0.0.2:9089": "10.0.0.2"},
+        )
+
+    def test_given_dns_name_is_cached_when_targets_change_in_next_hook_then_address_is_not_looked_up(  # noqa: E501
+        self,
+    ):
+        relation_id = self._add_targets("smf", ["10.0.0.1"])
+        self._reload_aggregator()
+
+        self.harness.update_relation_data(relation_id, "smf/0", {"other": "data"})
+
+        self.assertEqual(self._lookups("10.0.0.1"), 1)
+        self.assertEqual(self._dns_names(), {"10.0.0.1:9089": "host-10.0.0.1"})
+
+    @patch.object(prometheus_scrape, "time", Mock(wraps=time))
+    def test_given_cached_dns_name_expired_when_targets_change_then_address_is_looked_up_again(
+        self,
+    ):
+        prometheus_scrape.time.time.return_value = 1000.0
+        relation_id = self._add_targets("smf", ["10.0.0.1"])
+        self._reload_aggregator()
+        prometheus_scrape.time.time.return_value = 1000.0 + prometheus_scrape.DNS_CACHE_TTL
+
+        self.harness.update_relation_data(relation_id, "smf/0", {"other": "data"})
+
+        self.assertEqual(self._lookups("10.0.0.1"), 2)
+
+    def test_given_lookup_timed_out_when_targets_change_in_same_hook_then_address_is_not_looked_up_again(  # noqa: E501
+        self,
+    ):
+        self.slow_hostnames.add("10.0.0.1")
+        relation_id = self._add_targets("smf", ["10.0.0.1"])
+
+        self.harness.update_relation_data(relation_id, "smf/0", {"other": "data"})
+
+        self.assertEqual(self._lookups("10.0.0.1"), 1)
+        self.assertEqual(self._dns_names(), {"10.0.0.1:9089": "10.0.0.1"})
+
+    def test_given_lookup_timed_out_when_targets_change_in_next_hook_then_address_is_looked_up_again(  # noqa: E501
+        self,
+    ):
+        self.slow_hostnames.add("10.0.0.1")
+        relation_id = self._add_targets("smf", ["10.0.0.1"])
+        self.slow_hostnames.clear()
+        self._reload_aggregator()
+
+        self.harness.update_relation_data(relation_id, "smf/0", {"other": "data"})
+
+        self.assertEqual(self._lookups("10.0.0.1"), 2)
+        self.assertEqual(self._dns_names(), {"10.0.0.1:9089": "host-10.0.0.1"})
+
+    def test_given_address_cannot_be_resolved_when_targets_change_then_failure_is_cached(self):
+        self.patch_gethostbyaddr.side_effect = socket.herror("Unknown host")
+        relation_id = self._add_targets("smf", ["10.0.0.1"])
+
+        self.harness.update_relation_data(relation_id, "smf/0", {"other": "data"})
+
+        self.assertEqual(self._lookups("10.0.0.1"), 1)
+        self.assertEqual(self._dns_names(), {"10.0.0.1:9089": "10.0.0.1"})